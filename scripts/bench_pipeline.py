@@ -0,0 +1,304 @@
+"""Offline benchmark of the inventory → options → quote pipeline.
+
+Generates synthetic inventory CSV exports (realistic brand / color / location /
+thickness mixes, "$1,234.56" costs, sold-out rows and unused columns), then
+times each stage the app runs and records its peak traced memory:
+
+    ingest         load_normalized_inventory: chunked parse + normalize, as the app loads
+    parse          parse_inventory_csv on the raw CSV bytes (whole file, for reference)
+    normalize      normalize_inventory_df on that frame (whole file, for reference)
+    aggregate      aggregate_inventory (groupby, built-in reductions only)
+    index          OptionIndex construction
+    serials        SerialIndex construction (per-snapshot serial lookup)
+    options        OptionIndex.sufficient for every branch × thickness
+    pricing        price_options with a fresh CutPlanner and SourcingIndex (transfers,
+                   mixed-location plans) for every branch × thickness
+    pricing_apply  calculate_cost row by row over the same options (reference)
+    taxes          compute_taxes_frame over every query's priced options (one pass)
+    email          compose_breakdown_email_body for each query's cheapest option
+
+Run from the repository root (no network needed):
+
+    python -m scripts.bench_pipeline --sizes 1000,10000,100000,1000000 \\
+        --output .cache/bench/$(git rev-parse --short HEAD).json
+    python -m scripts.bench_pipeline --compare .cache/bench/OLD.json .cache/bench/NEW.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from src.costs import (
+    MINIMUM_SQ_FT,
+    WASTE_FACTOR,
+    calculate_cost,
+    compute_taxes_frame,
+    price_options,
+)
+from src.cut_optimizer import CutPlanner
+from src.data import (
+    BRANCH_TO_MATERIAL_SOURCES,
+    aggregate_inventory,
+    SerialIndex,
+    get_fab_plant,
+    load_normalized_inventory,
+    normalize_inventory_df,
+    parse_inventory_csv,
+)
+from src.email import compose_breakdown_email_body
+from src.option_index import OptionIndex
+from src.sourcing import SourcingIndex
+
+# name: (share of slabs, colors in the line, $/sq ft range)
+BRANDS = {
+    "Cambria":     (0.28, 120, (14.0, 32.0)),
+    "Silestone":   (0.20, 90, (11.0, 26.0)),
+    "Caesarstone": (0.16, 80, (12.0, 28.0)),
+    "Hanstone":    (0.12, 60, (9.0, 20.0)),
+    "Dekton":      (0.09, 50, (18.0, 40.0)),
+    "Vicostone":   (0.08, 45, (8.0, 18.0)),
+    "MSI Q":       (0.07, 70, (6.0, 14.0)),
+}
+LOCATIONS = {"Abbotsford": 0.32, "Vernon": 0.18, "Edmonton": 0.28, "Saskatoon": 0.22}
+THICKNESSES = {"3 cm": 0.72, "2 cm": 0.23, "1.2 cm": 0.05}
+QUERY_SQ_FT = 40
+
+STAGES = ["ingest", "parse", "normalize", "aggregate", "index", "serials", "options", "pricing", "pricing_apply", "taxes", "email"]
+
+
+def synthetic_inventory_csv(n_slabs: int, seed: int = 0) -> bytes:
+    """A deterministic inventory export with ``n_slabs`` rows."""
+    rng = np.random.default_rng(seed)
+    names = list(BRANDS)
+    brand_idx = rng.choice(len(names), n_slabs, p=[BRANDS[b][0] for b in names])
+    n_colors = np.array([BRANDS[b][1] for b in names])[brand_idx]
+    # A few colors dominate each line (Zipf-like), the long tail is thin.
+    color = np.minimum(rng.zipf(1.3, n_slabs), n_colors)
+    lo, hi = (np.array([BRANDS[b][2][i] for b in names])[brand_idx] for i in (0, 1))
+
+    qty = np.round(rng.normal(55.0, 6.0, n_slabs).clip(30.0, 80.0), 4)
+    remnant = rng.random(n_slabs) < 0.15
+    qty[remnant] = np.round(qty[remnant] * rng.uniform(0.1, 0.6, remnant.sum()), 4)
+    qty[rng.random(n_slabs) < 0.04] = 0.0  # sold out / on hold
+    on_hand = qty * rng.uniform(lo, hi)
+    cost = pd.Series(on_hand).map("${:,.2f}".format)
+    cost[rng.random(n_slabs) < 0.01] = ""  # missing cost
+
+    df = pd.DataFrame({
+        "Brand": np.array(names)[brand_idx],
+        "Color": np.char.add("Color ", color.astype(str)),
+        "Thickness": rng.choice(list(THICKNESSES), n_slabs, p=list(THICKNESSES.values())),
+        "Location": rng.choice(list(LOCATIONS), n_slabs, p=list(LOCATIONS.values())),
+        "Serial Number": rng.permutation(n_slabs) + 100_000,
+        "Available Qty": qty,
+        "Serialized On Hand Cost": cost,
+        "Warehouse Bin": rng.integers(1, 400, n_slabs),
+        "Notes": "",
+    })
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def _queries(opt_index: OptionIndex) -> list[tuple[str, str]]:
+    return [(b, th) for b in BRANCH_TO_MATERIAL_SOURCES for th in opt_index.thicknesses(b)]
+
+
+def _run_pipeline(data: bytes, measure: Callable[[str, Callable], object]) -> dict:
+    """Run every stage once through ``measure(name, fn)``; returns row counts."""
+    df_inv = measure("ingest", lambda: load_normalized_inventory(data))
+    raw = measure("parse", lambda: parse_inventory_csv(data))
+    measure("normalize", lambda: normalize_inventory_df(raw))
+    df_agg = measure("aggregate", lambda: aggregate_inventory(df_inv))
+    opt_index = measure("index", lambda: OptionIndex(df_agg, BRANCH_TO_MATERIAL_SOURCES))
+    serials = measure("serials", lambda: SerialIndex(df_inv))
+
+    queries = _queries(opt_index)
+    required = QUERY_SQ_FT * WASTE_FACTOR
+    sliced = measure("options", lambda: [opt_index.sufficient(b, th, required) for b, th in queries])
+
+    def pricing():
+        # Cold memos: every cut plan is searched and every sourcing table built.
+        cuts = CutPlanner(serials)
+        sourcing = SourcingIndex(df_agg, serials, BRANCH_TO_MATERIAL_SOURCES)
+        return [
+            price_options(s, QUERY_SQ_FT, cuts, sourcing.for_branch(b, th))
+            for (b, th), s in zip(queries, sliced)
+        ]
+
+    priced = measure("pricing", pricing)
+    measure(
+        "pricing_apply",
+        lambda: [s.apply(lambda r: calculate_cost(r.to_dict(), QUERY_SQ_FT), axis=1) for s in sliced],
+    )
+
+    def taxes():
+        # Every query's options at their branch rates in one pass, split back per query.
+        prices = np.concatenate([p["price"].to_numpy(dtype=float) for p in priced])
+        branches = np.repeat([b for b, _ in queries], [len(p) for p in priced])
+        out = compute_taxes_frame(prices, branches)
+        bounds = np.cumsum([len(p) for p in priced])[:-1]
+        return [out.iloc[a:b] for a, b in zip([0, *bounds], [*bounds, len(out)])]
+
+    tax_info = measure("taxes", taxes)
+
+    def emails():
+        out = []
+        for (branch, th), p, t in zip(queries, priced, tax_info):
+            if p.empty:
+                continue
+            rec = p.iloc[0].to_dict()
+            rec["serial_numbers"] = rec["cut_serials"] or serials.get(rec["serial_group"])
+            out.append(compose_breakdown_email_body(
+                job_name="Benchmark", selected_branch=branch, selected_salesperson="Bench",
+                rec=rec, costs=rec, fab_plant=get_fab_plant(branch), selected_thickness=th,
+                sq_ft_used=max(QUERY_SQ_FT, MINIMUM_SQ_FT), additional_costs=0.0,
+                subtotal=rec["price"], tax_info=t.iloc[0].to_dict(), final_total=t["final_total"].iat[0],
+                transfer_emails=["transfers@example.com"],
+            ))
+        return out
+
+    measure("email", emails)
+    return {
+        "rows_raw": len(raw),
+        "rows_normalized": len(df_inv),
+        "rows_aggregated": len(df_agg),
+        "queries": len(queries),
+        "options_priced": int(sum(len(p) for p in priced)),
+    }
+
+
+def bench_size(n_slabs: int, seed: int, repeat: int, memory: bool) -> dict:
+    data = synthetic_inventory_csv(n_slabs, seed)
+    times: dict[str, list[float]] = {s: [] for s in STAGES}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        out = fn()
+        times[name].append(time.perf_counter() - start)
+        return out
+
+    counts = {}
+    for _ in range(repeat):
+        gc.collect()
+        counts = _run_pipeline(data, timed)
+
+    peaks: dict[str, int] = {}
+    if memory:
+        # Separate pass: tracing slows allocation-heavy stages, so it never feeds the timings.
+        def traced(name, fn):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            out = fn()
+            peaks[name] = tracemalloc.get_traced_memory()[1] - before
+            return out
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            _run_pipeline(data, traced)
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "slabs": n_slabs,
+        "csv_bytes": len(data),
+        **counts,
+        "stages": {
+            s: {
+                "min_s": round(min(times[s]), 6),
+                "median_s": round(statistics.median(times[s]), 6),
+                **({"peak_bytes": peaks[s]} if s in peaks else {}),
+            }
+            for s in STAGES
+        },
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(result: dict) -> None:
+    print(
+        f"\n{result['slabs']:,} slabs · {result['csv_bytes'] / 1e6:.1f} MB CSV · "
+        f"{result['rows_normalized']:,} normalized · {result['rows_aggregated']:,} aggregated · "
+        f"{result['options_priced']:,} options priced over {result['queries']} queries"
+    )
+    for name, s in result["stages"].items():
+        peak = f"{s['peak_bytes'] / 2**20:9.1f} MiB" if "peak_bytes" in s else ""
+        print(f"  {name:<14} {s['min_s'] * 1000:10.2f} ms (median {s['median_s'] * 1000:.2f}) {peak}")
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Print new/old median-time ratios for every size and stage the two runs share."""
+    with open(old_path) as f:
+        old = {r["slabs"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {r["slabs"]: r for r in json.load(f)["results"]}
+    for n in sorted(old.keys() & new.keys()):
+        print(f"\n{n:,} slabs (new / old median)")
+        for stage, s in new[n]["stages"].items():
+            if stage in old[n]["stages"]:
+                before, after = old[n]["stages"][stage]["median_s"], s["median_s"]
+                ratio = after / before if before else float("inf")
+                flag = "  <-- slower" if ratio > 1.10 else ""
+                print(f"  {stage:<14} {before * 1000:10.2f} ms → {after * 1000:10.2f} ms  ×{ratio:.2f}{flag}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the inventory → options → quote pipeline.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated slab counts")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    for n in (int(s) for s in args.sizes.split(",")):
+        result = bench_size(n, args.seed, args.repeat, memory=not args.no_memory)
+        _print_table(result)
+        results.append(result)
+
+    if args.output:
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": sys.version.split()[0],
+                "numpy": np.__version__,
+                "pandas": pd.__version__,
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "repeat": args.repeat,
+                "query_sq_ft": QUERY_SQ_FT,
+            },
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Load generator for the local quote API (``python -m src.quote_api``).
+
+Opens ``--concurrency`` keep-alive connections and issues ``GET /quote``
+requests for random (branch, thickness, sq ft) combinations taken from
+``/health`` until ``--requests`` have completed or ``--duration`` seconds have
+passed, then prints throughput and latency percentiles (optionally as JSON).
+
+    python scripts/quote_load.py --concurrency 32 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from urllib.parse import urlencode
+
+
+async def _request(reader, writer, host: str, path: str) -> tuple[int, bytes]:
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def _worker(args, combos, deadline, counter, latencies, errors) -> None:
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    rng = random.Random()
+    try:
+        while time.perf_counter() < deadline and next(counter) < args.requests:
+            branch, thickness = rng.choice(combos)
+            query = {"branch": branch, "thickness": thickness, "sq_ft": rng.randint(10, 150), "limit": args.limit}
+            start = time.perf_counter()
+            try:
+                status, _ = await _request(reader, writer, args.host, "/quote?" + urlencode(query))
+            except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+                errors["connection"] = errors.get("connection", 0) + 1
+                writer.close()
+                reader, writer = await asyncio.open_connection(args.host, args.port)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+    finally:
+        writer.close()
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+async def run(args) -> dict:
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    status, body = await _request(reader, writer, args.host, "/health")
+    writer.close()
+    if status != 200:
+        raise SystemExit(f"/health returned {status}: {body.decode()}")
+    thicknesses = json.loads(body)["thicknesses"]
+    combos = [(b, th) for b, ths in thicknesses.items() for th in ths]
+    if not combos:
+        raise SystemExit("inventory has no stocked thicknesses")
+
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+    counter = iter(range(sys.maxsize))
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(args, combos, start + args.duration, counter, latencies, errors)
+        for _ in range(args.concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ms = lambda s: round(s * 1000, 2)  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": ms(_percentile(latencies, 50)),
+            "p90": ms(_percentile(latencies, 90)),
+            "p99": ms(_percentile(latencies, 99)),
+            "max": ms(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure quote API throughput and latency.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=sys.maxsize, help="stop after this many requests")
+    parser.add_argument("--limit", type=int, default=20, help="options per quote")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    lat = summary["latency_ms"]
+    print(
+        f"{summary['requests']} requests in {summary['elapsed_s']} s "
+        f"({summary['throughput_rps']} req/s, concurrency {summary['concurrency']})\n"
+        f"latency ms: p50 {lat['p50']} · p90 {lat['p90']} · p99 {lat['p99']} · max {lat['max']}\n"
+        f"errors: {summary['errors'] or 'none'}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Warm the inventory snapshot before the first session connects.
+
+Fetches and normalizes the inventory CSV into the on-disk snapshot, which the
+app and quote API seed from on a cold start. Only the snapshot carries over:
+this runs in its own process, so nothing else it could fetch (e.g. the
+Salespeople sheet) would reach the app.
+
+Prints the result and exits non-zero if the fetch failed:
+
+    python -m scripts.warmup; streamlit run streamlit_app.py
+"""
+import argparse
+import sys
+import time
+
+from src.data import INVENTORY_CSV_URL, INVENTORY_SNAPSHOT_PATH, INVENTORY_TTL_SECONDS, make_inventory_cache
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Fetch the inventory into the on-disk snapshot.")
+    parser.add_argument("--url", default=INVENTORY_CSV_URL, help="inventory CSV export URL")
+    parser.add_argument("--snapshot-path", default=INVENTORY_SNAPSHOT_PATH)
+    args = parser.parse_args(argv)
+
+    cache = make_inventory_cache(args.url, INVENTORY_TTL_SECONDS, args.snapshot_path)
+    start = time.perf_counter()
+    ok = cache.refresh()
+    elapsed = time.perf_counter() - start
+    if not ok:
+        print(f"{cache.name:<12} FAILED  {elapsed:6.2f} s  {cache.last_error}")
+        sys.exit(1)
+    df, _ = cache.snapshot.value  # get() would start another fetch once the snapshot is stale
+    print(f"{cache.name:<12} ok      {elapsed:6.2f} s  {len(df):,} rows")
+
+
+if __name__ == "__main__":
+    main()
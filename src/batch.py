@@ -0,0 +1,185 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from src import instrument
+from src.costs import MINIMUM_SQ_FT, WASTE_FACTOR, calculate_cost_frame, compute_taxes_frame
+from src.data import NO_TRANSFER_ROUTES, TransferRoutes
+from src.option_index import OptionIndex
+
+# Accepted header spellings (case/space-insensitive) for the jobs file.
+JOB_FILE_COLUMNS = {
+    "Job": {"job", "job name", "jobname", "name", "unit", "unit name"},
+    "Sq Ft": {"sq ft", "sqft", "sq_ft", "square feet", "square footage", "sq ft needed"},
+    "Thickness": {"thickness"},
+    "Branch": {"branch"},
+}
+
+
+@instrument.timed("jobs_file", count_rows=True)
+def read_jobs_file(file_name: str, data: bytes, default_branch: str) -> pd.DataFrame:
+    """Parse an uploaded CSV/XLSX of jobs into Job, Branch, Thickness_norm, Sq Ft."""
+    if file_name.lower().endswith((".xlsx", ".xls")):
+        raw = pd.read_excel(io.BytesIO(data))
+    else:
+        raw = pd.read_csv(io.BytesIO(data))
+    by_key = {" ".join(str(c).lower().replace("_", " ").split()): c for c in raw.columns}
+    cols = {}
+    for name, aliases in JOB_FILE_COLUMNS.items():
+        hit = next((by_key[a] for a in aliases if a in by_key), None)
+        if hit is not None:
+            cols[name] = raw[hit]
+    if "Sq Ft" not in cols:
+        raise ValueError(f"No square-footage column found. Columns found: {raw.columns.tolist()}")
+
+    jobs = pd.DataFrame(index=raw.index)
+    jobs["Job"] = cols.get("Job", pd.Series(raw.index + 1, index=raw.index)).astype(str).str.strip()
+    branch = cols.get("Branch", pd.Series(default_branch, index=raw.index))
+    jobs["Branch"] = branch.fillna(default_branch).astype(str).str.strip().str.title()
+    thickness = cols.get("Thickness", pd.Series("3cm", index=raw.index)).fillna("3cm")
+    jobs["Thickness_norm"] = thickness.astype(str).str.lower().str.replace(" ", "", regex=False)
+    jobs["Sq Ft"] = pd.to_numeric(cols["Sq Ft"], errors="coerce")
+    return jobs.reset_index(drop=True)
+
+
+def _plan_cheapest(cross: pd.DataFrame, job_of_row: np.ndarray, sq: np.ndarray, top_n: int, cuts):
+    """Cut-plan just enough (job, option) rows to rank each job's ``top_n`` exactly.
+
+    Price only grows with the slab area charged and no plan covers less than
+    the waste-adjusted requirement, so pricing a row at exactly that area (and
+    at most one slab's transfer) is a lower bound. Rows are planned cheapest bound first, until no unplanned row's
+    bound can beat its job's ``top_n``-th exact price. Returns the planned row
+    positions and those rows with the ``cut_*`` columns added.
+    """
+    lower = cross.assign(cut_sq_ft=sq * WASTE_FACTOR, cut_slabs=1)
+    if "transfer_per_slab" in lower:
+        # Rows without a slab count fall back to an estimate that moves no slabs.
+        lower["transfer_per_slab"] = lower["transfer_per_slab"].where(lower["slab_count"] > 0, 0.0)
+    bound = calculate_cost_frame(lower, sq)
+    bound = bound["total_customer_facing_base_cost"].to_numpy()
+    price = np.full(len(cross), np.inf)
+    kth = np.full(int(job_of_row.max()) + 1, np.inf)
+    plans = []
+
+    def ranked(key: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        order = np.lexsort((key, job_of_row))
+        return order, pd.Series(job_of_row[order]).groupby(job_of_row[order]).cumcount().to_numpy()
+
+    order, rank = ranked(bound)
+    todo = np.sort(order[rank < top_n])
+    while len(todo):
+        rows = cross.iloc[todo]
+        rows = pd.concat([rows, cuts.plan_frame(rows, sq[todo])], axis=1)
+        price[todo] = calculate_cost_frame(rows, sq[todo])["total_customer_facing_base_cost"].to_numpy()
+        plans.append(rows)
+        order, rank = ranked(price)
+        at_n = order[rank == top_n - 1]
+        kth[job_of_row[at_n]] = price[at_n]
+        todo = np.flatnonzero(np.isinf(price) & (bound <= kth[job_of_row]))
+
+    keep = np.flatnonzero(np.isfinite(price))
+    return keep, pd.concat(plans).sort_index().reset_index(drop=True)
+
+
+@instrument.timed("batch_quote", count_rows=True)
+def quote_jobs(
+    jobs: pd.DataFrame,
+    opt_index: OptionIndex,
+    top_n: int = 5,
+    cuts=None,
+    sourcing=None,
+    routes: TransferRoutes = NO_TRANSFER_ROUTES,
+) -> pd.DataFrame:
+    """Rank the ``top_n`` cheapest options for every job in one columnar pass.
+
+    Jobs sharing a (branch, thickness) are crossed with that slice's options
+    and priced together by ``calculate_cost_frame``; jobs with nothing that
+    fits get a single row with a Note. Prices are taxed at each job's branch
+    rates (``gst_amount`` / ``pst_amount`` / ``final_total``). With a
+    ``CutPlanner`` options are priced from the actual slabs to pull
+    (``cut_serials``), and with a ``SourcingIndex`` transfers are charged (at
+    ``routes``) and mixed-location plans ranked alongside, as in the app.
+    """
+    jobs = jobs.reset_index(drop=True)
+    sq_input = jobs["Sq Ft"].to_numpy(dtype=float)
+    sq_used = np.maximum(sq_input, MINIMUM_SQ_FT)
+    valid = np.isfinite(sq_input) & (sq_input > 0)
+
+    option_cols = ["Full Name", "Location", "available_sq_ft", "unit_cost", "slab_count"]
+    if cuts is not None:
+        option_cols.append("serial_group")
+    parts = []
+    groups = jobs[valid].groupby(["Branch", "Thickness_norm"], sort=False).indices
+    for (branch, thickness), rows in groups.items():
+        opts = opt_index.slice(branch, thickness).frame[option_cols]
+        if opts.empty:
+            continue
+        job_pos = np.flatnonzero(valid)[rows]
+        cross = opts.iloc[np.tile(np.arange(len(opts)), len(job_pos))].reset_index(drop=True)
+        job_of_row = np.repeat(job_pos, len(opts))
+        sq = sq_used[job_of_row]
+        fits = cross["available_sq_ft"].to_numpy() >= sq * WASTE_FACTOR
+        cross, job_of_row, sq = cross[fits].reset_index(drop=True), job_of_row[fits], sq[fits]
+        if sourcing is not None:
+            query = sourcing.for_branch(branch, thickness, routes=routes)
+            cross = pd.concat([cross, query.transfers(cross["Location"].astype(object))], axis=1)
+        if cuts is not None and len(cross):
+            keep, cross = _plan_cheapest(cross, job_of_row, sq, top_n, cuts)
+            job_of_row, sq = job_of_row[keep], sq[keep]
+        if sourcing is not None:
+            # Mixed-location plans depend only on the job size; append them after the
+            # single-location rows, as the app does, so equal prices rank the same.
+            mixed, mixed_jobs = [], []
+            for size in np.unique(sq_used[job_pos]):
+                plans = query.mixed_options(size)
+                if len(plans):
+                    for job in job_pos[sq_used[job_pos] == size]:
+                        mixed.append(plans)
+                        mixed_jobs.append(np.full(len(plans), job))
+            if mixed:
+                cross = pd.concat([cross, *mixed], ignore_index=True)
+                job_of_row = np.concatenate([job_of_row, *mixed_jobs])
+                sq = sq_used[job_of_row]
+        if cross.empty:
+            continue
+        costs = calculate_cost_frame(cross, sq)
+        parts.append(
+            cross.assign(
+                _job=job_of_row,
+                price=costs["total_customer_facing_base_cost"],
+                price_per_sq_ft=costs["total_customer_facing_base_cost"].to_numpy() / sq,
+                ib_cost_component=costs["ib_cost_component"],
+                slabs_needed=costs["slabs_needed"],
+                transfer_cost=costs["transfer_cost"],
+            )
+        )
+
+    result_cols = [
+        "Rank", "Full Name", "Location", "price", "price_per_sq_ft",
+        "ib_cost_component", "slabs_needed", "available_sq_ft", "slab_count",
+    ]
+    if cuts is not None:
+        result_cols.append("cut_serials")
+    if sourcing is not None:
+        result_cols += ["transfer_cost", "lead_days"]
+    tax_cols = ["gst_amount", "pst_amount", "final_total"]
+    if parts:
+        priced = pd.concat(parts, ignore_index=True)
+        order = np.lexsort((priced["price"].to_numpy(), priced["_job"].to_numpy()))
+        priced = priced.iloc[order].reset_index(drop=True)
+        priced["Rank"] = priced.groupby("_job").cumcount() + 1
+        priced = priced[priced["Rank"] <= top_n].set_index("_job")[result_cols]
+        # Every job's branch tax in one pass.
+        taxes = compute_taxes_frame(priced["price"].to_numpy(), jobs["Branch"].to_numpy(dtype=object)[priced.index])
+        priced = priced.assign(**{c: taxes[c].to_numpy() for c in tax_cols})
+    else:
+        priced = pd.DataFrame(columns=result_cols + tax_cols)
+
+    out = jobs.assign(**{"Sq Ft Used": sq_used}).join(priced, how="left")
+    out["Note"] = ""
+    out.loc[out["Rank"].isna(), "Note"] = (
+        f"No slabs have enough material (including {int((WASTE_FACTOR - 1) * 100)}% buffer)"
+    )
+    out.loc[~valid[out.index], "Note"] = "Invalid square footage"
+    return out.reset_index(drop=True)
@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from src import instrument
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """A loaded value plus the wall-clock time it was fetched."""
+
+    value: Any
+    fetched_at: float
+
+    @property
+    def age_seconds(self) -> float:
+        return max(time.time() - self.fetched_at, 0.0)
+
+
+class SnapshotCache:
+    """Stale-while-revalidate cache for a single expensive value.
+
+    The first ``get()`` loads synchronously. Afterwards ``get()`` always returns
+    the last good snapshot immediately; once it is older than ``ttl`` seconds a
+    single background thread fetches a replacement. A failed fetch, or one that
+    ``validate`` rejects, keeps the previous snapshot and records ``last_error``;
+    the next attempt waits ``retry_after`` seconds (default: ``ttl``).
+
+    A new snapshot replaces the old one with a single reference swap, so a
+    caller holding a ``Snapshot`` keeps a consistent value for as long as it
+    needs it; the value itself is shared, never copied, so loaders should
+    return something read-only (see ``src.data.freeze_frame``).
+
+    ``load_async()`` starts the first load in the background, so independent
+    caches can fetch concurrently before anyone waits on ``get()``.
+
+    ``seed`` pre-populates the cache (e.g. from an on-disk copy) so the first
+    ``get()`` returns at once and revalidates in the background. ``on_update``
+    is called with every successfully fetched snapshot; its errors are logged
+    and never affect serving.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Any],
+        ttl: float,
+        validate: Callable[[Any], None] | None = None,
+        name: str = "snapshot",
+        retry_after: float | None = None,
+        seed: Snapshot | None = None,
+        on_update: Callable[[Snapshot], None] | None = None,
+    ):
+        self._loader = loader
+        self._validate = validate
+        self.ttl = float(ttl)
+        self.retry_after = self.ttl if retry_after is None else float(retry_after)
+        self.name = name
+        self._on_update = on_update
+        self._snapshot: Snapshot | None = seed
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._attempts = 0  # completed fetches, successful or not
+        self.last_error: Exception | None = None
+        self.last_attempt_at: float | None = None
+
+    @property
+    def snapshot(self) -> Snapshot | None:
+        return self._snapshot
+
+    @property
+    def refreshing(self) -> bool:
+        return self._refreshing
+
+    def is_stale(self) -> bool:
+        snap = self._snapshot
+        return snap is None or snap.age_seconds >= self.ttl
+
+    def _should_refresh(self) -> bool:
+        last = self.last_attempt_at
+        if last is not None and not self.is_stale():
+            return False
+        # A seeded snapshot has never been fetched in this process: revalidate now.
+        return last is None or time.time() - last >= self.retry_after
+
+    def get(self) -> Snapshot:
+        """Return the current snapshot, loading it synchronously only if there is none."""
+        snap = self._snapshot
+        instrument.cache_event(self.name, hit=snap is not None)
+        if snap is None:
+            with instrument.stage(f"{self.name}.load"):
+                self._load_first(self._attempts)
+            snap = self._snapshot
+            if snap is None:
+                raise self.last_error or RuntimeError(f"{self.name}: no snapshot available")
+        elif self._should_refresh():
+            self.refresh_async()
+        return snap
+
+    def _load_first(self, attempts_seen: int) -> None:
+        with self._load_lock:
+            # Concurrent first callers share one load; if an attempt finished while
+            # we waited for it, its outcome (snapshot or last_error) stands.
+            if self._snapshot is None and self._attempts == attempts_seen:
+                self._fetch()
+
+    def load_async(self) -> bool:
+        """Start the first load in the background; ``get()`` then waits for it.
+
+        Once a snapshot exists this is ``get()``'s usual staleness check. Returns
+        whether a background fetch was started.
+        """
+        if self._snapshot is not None:
+            return self._should_refresh() and self.refresh_async()
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        attempts_seen = self._attempts
+
+        def _run():
+            try:
+                self._load_first(attempts_seen)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_run, name=f"{self.name}-load", daemon=True).start()
+        return True
+
+    def refresh(self) -> bool:
+        """Fetch synchronously; swap the snapshot in only if the new value is valid."""
+        with self._load_lock:
+            return self._fetch()
+
+    def _fetch(self) -> bool:
+        self.last_attempt_at = time.time()
+        try:
+            value = self._loader()
+            if self._validate is not None:
+                self._validate(value)
+        except Exception as e:
+            self.last_error = e
+            self._attempts += 1
+            return False
+        snap = Snapshot(value=value, fetched_at=time.time())
+        self._snapshot = snap
+        self.last_error = None
+        self._attempts += 1
+        if self._on_update is not None:
+            try:
+                self._on_update(snap)
+            except Exception:
+                logger.exception("%s: on_update callback failed", self.name)
+        return True
+
+    def refresh_async(self) -> bool:
+        """Start a background refresh unless one is already running."""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+
+        def _run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_run, name=f"{self.name}-refresh", daemon=True).start()
+        return True
+
+
+def format_age(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
@@ -1,18 +1,283 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from src.money import money, to_cents, to_cents_array
+
+# --- Constants ---
+MINIMUM_SQ_FT = 35
 MARKUP_FACTOR = 1.51
-INSTALL_COST_PER_SQFT = 21
-FABRICATION_COST_PER_SQFT = 17
+INSTALL_COST_PER_SQFT = 21.0
+FABRICATION_COST_PER_SQFT = 15.0  # CHANGED to $15 as requested
+WASTE_FACTOR = 1.05
 IB_MATERIAL_MARKUP = 1.05
+IB_MIN_MARGIN = 0.18  # NEW: ensure IB is at least 18% gross margin over (slab + fab)
+
+# --- Tax configuration by branch ---
+BRANCH_TAX_RATES = {
+    "Vernon":    {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
+    "Victoria":  {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
+    "Vancouver": {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
+    "Calgary":   {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
+    "Edmonton":  {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
+    "Saskatoon": {"gst": 0.05, "pst": 0.06, "pst_name": "PST"},
+    "Winnipeg":  {"gst": 0.05, "pst": 0.00, "pst_name": "RST"},
+    "default":   {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
+}
 
 
 def calculate_cost(rec: dict, sq: float) -> dict:
-    uc = rec.get("unit_cost", 0) or 0
-    mat = uc * MARKUP_FACTOR * sq
-    fab = FABRICATION_COST_PER_SQFT * sq
-    ins = INSTALL_COST_PER_SQFT * sq
-    ib = ((uc * IB_MATERIAL_MARKUP) + FABRICATION_COST_PER_SQFT) * sq
+    uc = float(rec.get("unit_cost", 0) or 0)
+
+    # Determine how many full slabs are required to satisfy the job (with waste)
+    # rather than charging for every square foot currently in stock.
+    available_sq_ft = float(rec.get("available_sq_ft", 0) or 0)
+    slab_count = int(rec.get("slab_count", 0) or 0)
+    required_sq_ft = sq * WASTE_FACTOR
+
+    avg_slab_sq_ft = 0.0
+    if slab_count > 0 and available_sq_ft > 0:
+        avg_slab_sq_ft = available_sq_ft / slab_count
+
+    # A cut plan (see src.cut_optimizer) names the actual slabs; charge their real area.
+    cut_sq_ft = float(rec.get("cut_sq_ft", math.nan))
+    if cut_sq_ft > 0:
+        slabs_needed = int(rec["cut_slabs"])
+        slab_sq_ft = cut_sq_ft
+    elif avg_slab_sq_ft > 0:
+        slabs_needed = max(1, math.ceil(required_sq_ft / avg_slab_sq_ft))
+        if slab_count:
+            slabs_needed = min(slabs_needed, slab_count)
+        slab_sq_ft = slabs_needed * avg_slab_sq_ft
+    else:
+        slabs_needed = 0
+        slab_sq_ft = max(required_sq_ft, sq, available_sq_ft)
+
+    # Moving the slabs to the fab plant (see src.sourcing); 0 when they are already there.
+    transfer_cost = float(rec.get("transfer_per_slab", 0) or 0) * slabs_needed
+
+    material_cost_used = uc * sq
+    total_slab_cost = uc * slab_sq_ft
+    unused_material_cost = max(total_slab_cost - material_cost_used, 0.0)
+
+    # Customer-facing build: charge the full slab cost, but only mark up the
+    # portion of material used on the job.
+    material_markup = material_cost_used * max(MARKUP_FACTOR - 1.0, 0.0)
+    mat_component = total_slab_cost + material_markup
+    fab_component = FABRICATION_COST_PER_SQFT * sq
+    ins_component = INSTALL_COST_PER_SQFT * sq
+
+    # IB pricing — ensure at least 18% margin on the full slab + fabrication cost.
+    base_cost_for_ib_total = total_slab_cost + fab_component
+    if base_cost_for_ib_total > 0:
+        ib_candidate_margin_total = base_cost_for_ib_total / (1.0 - IB_MIN_MARGIN)
+    else:
+        ib_candidate_margin_total = 0.0
+
+    ib_candidate_markup_total = (
+        (material_cost_used * IB_MATERIAL_MARKUP)
+        + unused_material_cost
+        + fab_component
+    )
+
+    if ib_candidate_margin_total >= ib_candidate_markup_total:
+        ib_total = ib_candidate_margin_total
+        ib_method = "margin_floor"  # 18% floor applied on full cost
+    else:
+        ib_total = ib_candidate_markup_total
+        ib_method = "markup_chain"   # legacy markup method with unused cost pass-through
+
+    # Margin % is (price - cost) / price
+    ib_margin_pct = 0.0
+    if ib_total > 0:
+        ib_margin_pct = 1.0 - (base_cost_for_ib_total / ib_total)
+
+    ib_per_sq = ib_total / sq if sq else 0.0
+    ib_base_cost_per_sq = base_cost_for_ib_total / sq if sq else 0.0
+
+    return {
+        "base_material_and_fab_component": mat_component + fab_component,
+        "base_install_cost_component":     ins_component,
+        "ib_cost_component":               ib_total,
+        "transfer_cost":                   transfer_cost,
+        "total_customer_facing_base_cost": mat_component + fab_component + ins_component + transfer_cost,
+        # Extras for UI transparency
+        "ib_per_sq": ib_per_sq,
+        "ib_base_cost_per_sq": ib_base_cost_per_sq,
+        "ib_margin_pct": ib_margin_pct,
+        "ib_method": ib_method,
+    }
+
+
+def calculate_cost_frame(df: pd.DataFrame, sq: float | np.ndarray) -> pd.DataFrame:
+    """Columnar twin of ``calculate_cost`` for every row of an aggregated frame.
+
+    Mirrors the scalar arithmetic step for step so results match to the cent;
+    ``calculate_cost`` remains the reference implementation. ``sq`` is either
+    one job size for all rows or an array with one size per row (batch quoting).
+    """
+    uc = pd.to_numeric(df["unit_cost"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    available_sq_ft = pd.to_numeric(df["available_sq_ft"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    slab_count = pd.to_numeric(df["slab_count"], errors="coerce").fillna(0).to_numpy(dtype=float).astype(np.int64)
+    required_sq_ft = sq * WASTE_FACTOR
+
+    has_avg = (slab_count > 0) & (available_sq_ft > 0)
+    avg_slab_sq_ft = np.divide(
+        available_sq_ft, slab_count, out=np.zeros_like(available_sq_ft), where=has_avg
+    )
+    has_avg = avg_slab_sq_ft > 0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slabs_needed = np.maximum(1, np.ceil(required_sq_ft / avg_slab_sq_ft))
+    slabs_needed = np.where(slab_count > 0, np.minimum(slabs_needed, slab_count), slabs_needed)
+    slabs_needed = np.where(has_avg, slabs_needed, 0).astype(np.int64)
+    slab_sq_ft = np.where(
+        has_avg,
+        slabs_needed * avg_slab_sq_ft,
+        np.maximum(np.maximum(required_sq_ft, sq), available_sq_ft),
+    )
+    if "cut_sq_ft" in df:
+        cut_sq_ft = df["cut_sq_ft"].to_numpy(dtype=float)
+        has_cut = cut_sq_ft > 0  # False for NaN (no plan)
+        slab_sq_ft = np.where(has_cut, cut_sq_ft, slab_sq_ft)
+        slabs_needed = np.where(has_cut, df["cut_slabs"].to_numpy(dtype=float), slabs_needed).astype(np.int64)
+
+    transfer_per_slab = (
+        pd.to_numeric(df["transfer_per_slab"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        if "transfer_per_slab" in df else 0.0
+    )
+    transfer_cost = transfer_per_slab * slabs_needed
+
+    material_cost_used = uc * sq
+    total_slab_cost = uc * slab_sq_ft
+    unused_material_cost = np.maximum(total_slab_cost - material_cost_used, 0.0)
+
+    material_markup = material_cost_used * max(MARKUP_FACTOR - 1.0, 0.0)
+    mat_component = total_slab_cost + material_markup
+    fab_component = FABRICATION_COST_PER_SQFT * sq
+    ins_component = INSTALL_COST_PER_SQFT * sq
+
+    base_cost_for_ib_total = total_slab_cost + fab_component
+    ib_candidate_margin_total = np.where(
+        base_cost_for_ib_total > 0, base_cost_for_ib_total / (1.0 - IB_MIN_MARGIN), 0.0
+    )
+    ib_candidate_markup_total = (
+        (material_cost_used * IB_MATERIAL_MARKUP)
+        + unused_material_cost
+        + fab_component
+    )
+
+    use_floor = ib_candidate_margin_total >= ib_candidate_markup_total
+    ib_total = np.where(use_floor, ib_candidate_margin_total, ib_candidate_markup_total)
+    ib_method = np.where(use_floor, "margin_floor", "markup_chain")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ib_margin_pct = np.where(ib_total > 0, 1.0 - (base_cost_for_ib_total / ib_total), 0.0)
+
+    return pd.DataFrame(
+        {
+            "slabs_needed": slabs_needed,
+            "slab_sq_ft": slab_sq_ft,
+            "material_markup": material_markup,
+            "base_material_and_fab_component": mat_component + fab_component,
+            "base_install_cost_component": ins_component,
+            "ib_cost_component": ib_total,
+            "transfer_cost": transfer_cost,
+            "total_customer_facing_base_cost": mat_component + fab_component + ins_component + transfer_cost,
+            "ib_per_sq": _per_sq(ib_total, sq),
+            "ib_base_cost_per_sq": _per_sq(base_cost_for_ib_total, sq),
+            "ib_margin_pct": ib_margin_pct,
+            "ib_method": ib_method,
+        },
+        index=df.index,
+    )
+
+
+def _per_sq(total: np.ndarray, sq: float | np.ndarray) -> np.ndarray:
+    sq = np.broadcast_to(np.asarray(sq, dtype=float), np.shape(total))
+    return np.divide(total, sq, out=np.zeros(np.shape(total)), where=sq != 0)
+
+
+def price_options(df_agg: pd.DataFrame, sq: float, cuts=None, sourcing=None) -> pd.DataFrame:
+    """Price every option once and sort cheapest first.
+
+    Each row carries its full ``calculate_cost`` breakdown plus ``price`` and the
+    selectbox ``label``, so selection, detail view and email never re-price.
+    With a ``CutPlanner`` each option is priced from the actual slabs it would
+    use (``cut_slabs`` / ``cut_sq_ft`` / ``cut_serials``) instead of an
+    average slab size. With a ``BranchSourcing`` the price includes moving
+    the slabs to the fab plant, and mixed-location plans are ranked alongside.
+    """
+    if cuts is not None:
+        df_agg = pd.concat([df_agg, cuts.plan_frame(df_agg, sq)], axis=1)
+    if sourcing is not None:
+        df_agg = sourcing.apply(df_agg, sq)
+    costs = calculate_cost_frame(df_agg, sq)
+    priced = pd.concat([df_agg, costs], axis=1)
+    priced["price"] = costs["total_customer_facing_base_cost"]
+    priced = priced.sort_values("price", ascending=True, ignore_index=True)
+    lead_days = priced["lead_days"].tolist() if "lead_days" in priced else [0] * len(priced)
+    priced["label"] = [
+        f"{name} – {money(price / sq)}/sq ft" + (f" ({location}, +{days} days)" if days else "")
+        for name, price, location, days in zip(priced["Full Name"], priced["price"], priced["Location"], lead_days)
+    ]
+    return priced
+
+
+def options_within_budget(priced: pd.DataFrame, budget: float) -> pd.DataFrame:
+    """Rows of a price-sorted frame with ``price <= budget`` (binary search, no scan)."""
+    pos = int(np.searchsorted(priced["price"].to_numpy(), budget, side="right"))
+    return priced.iloc[:pos]
+
+
+def compute_taxes(subtotal: float, tax_rates: dict) -> dict:
+    gst_rate = float(tax_rates.get("gst", 0.05))
+    pst_rate = float(tax_rates.get("pst", 0.00))
+    pst_name = tax_rates.get("pst_name", "PST")
+
+    gst_cents = to_cents(subtotal * gst_rate)
+    pst_cents = to_cents(subtotal * pst_rate)
+    final_cents = to_cents(subtotal) + gst_cents + pst_cents
+
     return {
-        "base_material_and_fab_component": mat + fab,
-        "base_install_cost_component": ins,
-        "ib_cost_component": ib,
-        "total_customer_facing_base_cost": mat + fab + ins,
+        "gst_rate": gst_rate,
+        "pst_rate": pst_rate,
+        "pst_name": pst_name,
+        "gst_amount": gst_cents / 100,
+        "pst_amount": pst_cents / 100,
+        "final_total": final_cents / 100,
     }
+
+
+def compute_taxes_frame(subtotals, tax_rates) -> pd.DataFrame:
+    """``compute_taxes`` for many subtotals in one pass: a row per subtotal with the same keys and cents.
+
+    ``tax_rates`` is one rates dict for every row, or a branch per row (array-like)
+    looked up in ``BRANCH_TAX_RATES``, so a multi-branch batch is taxed together.
+    """
+    sub = np.asarray(subtotals, dtype=float)
+    if isinstance(tax_rates, dict):
+        gst_rate = float(tax_rates.get("gst", 0.05))
+        pst_rate = float(tax_rates.get("pst", 0.00))
+        pst_name = tax_rates.get("pst_name", "PST")
+    else:
+        codes, branches = pd.factorize(np.asarray(tax_rates, dtype=object))
+        rates = [BRANCH_TAX_RATES.get(b, BRANCH_TAX_RATES["default"]) for b in branches]
+        rates.append(BRANCH_TAX_RATES["default"])  # code -1: no branch
+        gst_rate = np.array([float(r.get("gst", 0.05)) for r in rates])[codes]
+        pst_rate = np.array([float(r.get("pst", 0.00)) for r in rates])[codes]
+        pst_name = np.array([r.get("pst_name", "PST") for r in rates], dtype=object)[codes]
+    gst_cents = to_cents_array(sub * gst_rate)
+    pst_cents = to_cents_array(sub * pst_rate)
+    return pd.DataFrame(
+        {
+            "gst_rate": gst_rate,
+            "pst_rate": pst_rate,
+            "pst_name": pst_name,
+            "gst_amount": gst_cents / 100,
+            "pst_amount": pst_cents / 100,
+            "final_total": (to_cents_array(sub) + gst_cents + pst_cents) / 100,
+        },
+        index=subtotals.index if isinstance(subtotals, pd.Series) else None,
+    )
@@ -0,0 +1,268 @@
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src import instrument
+from src.costs import WASTE_FACTOR
+from src.data import SerialIndex
+
+# Areas are compared in hundredths of a sq ft: slab areas are floored and the
+# requirement is ceiled, so a plan found on the grid always covers it for real.
+_SCALE = 100
+# Branch-and-bound nodes per plan before falling back to the exact DP; groups with
+# more small slabs than MAX_DFS_SLABS go straight to the DP (bounded recursion).
+NODE_BUDGET = 5000
+MAX_DFS_SLABS = 400
+# Each option's slabs get one table answering every requirement up to this many sq
+# ft (waste included) on the same grid; bigger jobs go to best_cut. A table first
+# covers MIN_TABLE_SQ_FT and doubles when a bigger job needs it.
+MAX_TABLE_SQ_FT = 420
+MIN_TABLE_SQ_FT = 128
+# Tables kept per planner (one per snapshot), least recently used dropped first.
+MAX_TABLE_BYTES = 48 << 20
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class CutPlan:
+    """The serial-numbered slabs to pull for one job and their real total area."""
+
+    serials: tuple[str, ...]
+    sq_ft: float
+
+    @property
+    def slabs(self) -> int:
+        return len(self.serials)
+
+
+def best_cut(areas: np.ndarray, required: float, node_budget: int = NODE_BUDGET) -> tuple[int, ...] | None:
+    """Indices of the slabs whose total area covers ``required`` with the least leftover.
+
+    Ties go to fewer slabs. Returns None when all slabs together fall short.
+    Any set containing a slab at least as large as ``required`` is dominated by
+    the smallest such slab, so only smaller slabs are combined: first by a
+    depth-first branch and bound (largest first, seeded with the greedy plan and
+    pruned on the best leftover so far), then, if that runs out of
+    ``node_budget``, by an exact subset-sum DP bounded by the best plan found.
+    """
+    grid = np.floor(np.asarray(areas, dtype=float) * _SCALE + 1e-6).astype(np.int64)
+    need = math.ceil(required * _SCALE - 1e-6)
+    if need <= 0:
+        return ()
+
+    best_sum, best_set = math.inf, None
+    big = np.flatnonzero(grid >= need)
+    if len(big):
+        j = int(big[np.argmin(grid[big])])
+        best_sum, best_set = int(grid[j]), (j,)
+        if best_sum == need:
+            return best_set
+
+    small = np.flatnonzero(grid < need)
+    small = small[np.argsort(-grid[small], kind="stable")]
+    vals = grid[small].tolist()
+    if sum(vals) < need:
+        return best_set
+    # Greedy incumbent (largest first until covered) bounds both searches below.
+    k = int(np.searchsorted(np.cumsum(vals), need))
+    if sum(vals[: k + 1]) < best_sum:
+        best_sum, best_set = sum(vals[: k + 1]), tuple(int(i) for i in small[: k + 1])
+    if len(vals) > MAX_DFS_SLABS:
+        return _best_cut_dp(vals, small, need, best_sum, best_set)
+    suffix = np.concatenate([np.cumsum(vals[::-1])[::-1], [0]]).tolist()
+    n = len(vals)
+
+    nodes = 0
+    chosen: list[int] = []
+
+    def dfs(i: int, total: int) -> None:
+        nonlocal best_sum, best_set, nodes
+        if total >= need:
+            if total < best_sum or (total == best_sum and len(chosen) < len(best_set)):
+                best_sum, best_set = total, tuple(int(small[k]) for k in chosen)
+            return
+        nodes += 1
+        if i == n or nodes > node_budget or total + suffix[i] < need or best_sum == need:
+            return
+        if total + vals[i] <= best_sum:
+            chosen.append(i)
+            dfs(i + 1, total + vals[i])
+            chosen.pop()
+        # Skip equal-sized slabs when excluding: taking the first k of them covers every choice.
+        j = i + 1
+        while j < n and vals[j] == vals[i]:
+            j += 1
+        dfs(j, total)
+
+    dfs(0, 0)
+    if nodes <= node_budget or best_sum == need:
+        return best_set
+    return _best_cut_dp(vals, small, need, best_sum, best_set)
+
+
+def _best_cut_dp(vals: list[int], idx: np.ndarray, need: int, best_sum, best_set):
+    """Exact subset-sum over sums below the incumbent ``best_sum`` (bitset + parent pointers)."""
+    cap = int(min(best_sum - 1, sum(vals)))  # only sums below the incumbent can improve on it
+    reach = np.zeros(cap + 1, dtype=bool)
+    parent = np.full(cap + 1, -1, dtype=np.int32)
+    reach[0] = True
+    for k, v in enumerate(vals):
+        if v > cap:
+            continue
+        new = reach[: cap + 1 - v] & ~reach[v:]
+        pos = np.flatnonzero(new) + v
+        reach[pos] = True
+        parent[pos] = k
+    hits = np.flatnonzero(reach[need:]) + need
+    if not len(hits):
+        return best_set
+    p, picked = int(hits[0]), []
+    while p > 0:
+        k = int(parent[p])
+        picked.append(int(idx[k]))
+        p -= vals[k]
+    return tuple(picked)
+
+
+class _CutTable:
+    """Least-leftover slab set of one option for every requirement up to ``limit``.
+
+    ``parent[s]`` is the slab with which a sum of exactly ``s`` (areas floored
+    to the grid) first becomes reachable, as in ``_best_cut_dp``, so a plan is
+    the first reachable sum at or above the requirement, walked back through
+    the parents. Slabs are added largest first, which keeps ties on few slabs.
+    The best cover of ``j`` sums to less than ``j`` plus its smallest slab, so
+    sums stop at ``limit`` plus the largest slab (or at all slabs together,
+    which answers every requirement).
+    """
+
+    def __init__(self, areas: np.ndarray, limit: int):
+        grid = np.floor(np.asarray(areas, dtype=float) * _SCALE + 1e-6).astype(np.int64)
+        cap = int(min(grid.sum(), limit + grid.max(initial=0)))
+        self.limit = limit if cap < grid.sum() else math.inf
+        # Only the first ceil(cap / size) slabs of one size can be in a cover; empty ones never help.
+        order = np.argsort(-grid, kind="stable")
+        sizes = grid[order]
+        rank = np.arange(len(sizes)) - np.searchsorted(-sizes, -sizes, side="left")
+        keep = (sizes > 0) & (sizes <= cap) & (rank < -(-cap // np.maximum(sizes, 1)))
+        self.slabs = order[keep]
+        self.grid = sizes[keep]
+
+        dtype = np.min_scalar_type(len(self.grid) + 1)
+        self._none = np.iinfo(dtype).max
+        parent = np.full(cap + 1, self._none, dtype=dtype)
+        reach = np.zeros(cap + 1, dtype=bool)
+        reach[0] = True
+        for k, v in enumerate(self.grid.tolist()):
+            pos = np.flatnonzero(reach[: cap + 1 - v] & ~reach[v:]) + v
+            reach[pos] = True
+            parent[pos] = k
+        self._parent = parent
+
+    @property
+    def nbytes(self) -> int:
+        return self._parent.nbytes + self.slabs.nbytes + self.grid.nbytes
+
+    def plan(self, need: int) -> np.ndarray | None:
+        """Positions (into the option's slabs) of the least-leftover cover of ``need``."""
+        if need <= 0:
+            return np.zeros(0, dtype=np.int64)
+        hits = np.flatnonzero(self._parent[need:] != self._none)
+        if not len(hits):
+            return None
+        s, picked = need + int(hits[0]), []
+        while s > 0:
+            k = int(self._parent[s])
+            picked.append(int(self.slabs[k]))
+            s -= int(self.grid[k])
+        return np.array(picked, dtype=np.int64)
+
+
+class CutPlanner:
+    """Memoized cut plans per (aggregated option, required sq ft) for one inventory snapshot.
+
+    Each option's slabs get a ``_CutTable`` the first time the option is
+    planned, shared by every job size it covers after that (rebuilt twice as
+    large for a bigger job); a plan is then a lookup and a walk back. Jobs
+    past MAX_TABLE_SQ_FT are searched by ``best_cut``. Tables are kept up to
+    ``max_table_bytes`` in total, least recently used evicted first.
+    """
+
+    def __init__(self, serials: SerialIndex, max_entries: int = 50_000, max_table_bytes: int = MAX_TABLE_BYTES):
+        self._serials = serials
+        self._slabs: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        self._tables: OrderedDict[int, _CutTable] = OrderedDict()
+        self._table_bytes = 0
+        self._tables_lock = threading.Lock()
+        self._plans: dict[tuple[int, int], CutPlan | None] = {}
+        self._max_entries = max_entries
+        self._max_table_bytes = max_table_bytes
+
+    @property
+    def serials(self) -> SerialIndex:
+        return self._serials
+
+    def plan(self, serial_group: int, required: float) -> CutPlan | None:
+        key = (int(serial_group), math.ceil(required * _SCALE - 1e-6))
+        # One lookup: another thread may clear the memo between `in` and `[]`.
+        plan = self._plans.get(key, _MISSING)
+        if plan is not _MISSING:
+            instrument.cache_event("cut_plan", hit=True)
+            return plan
+        instrument.cache_event("cut_plan", hit=False)
+        slabs = self._slabs.get(key[0])
+        if slabs is None:
+            slabs = self._slabs[key[0]] = self._serials.slabs(key[0])
+        names, areas = slabs
+        if required <= MAX_TABLE_SQ_FT:
+            picked = self._table(key[0], areas, key[1]).plan(key[1])
+        else:
+            picked = best_cut(areas, required)
+        plan = None
+        if picked is not None:
+            picked = sorted(picked, key=lambda k: names[k])
+            plan = CutPlan(tuple(str(names[k]) for k in picked), float(areas[picked].sum()))
+        if len(self._plans) >= self._max_entries:
+            self._plans.clear()
+        self._plans[key] = plan
+        return plan
+
+    def _table(self, serial_group: int, areas: np.ndarray, need: int) -> _CutTable:
+        with self._tables_lock:
+            table = self._tables.get(serial_group)
+            if table is not None:
+                self._tables.move_to_end(serial_group)
+        if table is None or need > table.limit:
+            limit = MIN_TABLE_SQ_FT * _SCALE
+            while limit < need:
+                limit *= 2
+            # Built outside the lock; if two threads race, the later table replaces the earlier.
+            table = _CutTable(areas, min(limit, MAX_TABLE_SQ_FT * _SCALE))
+            with self._tables_lock:
+                old = self._tables.pop(serial_group, None)
+                if old is not None:
+                    self._table_bytes -= old.nbytes
+                self._tables[serial_group] = table
+                self._table_bytes += table.nbytes
+                while self._table_bytes > self._max_table_bytes and len(self._tables) > 1:
+                    self._table_bytes -= self._tables.popitem(last=False)[1].nbytes
+        return table
+
+    def plan_frame(self, df: pd.DataFrame, sq: float | np.ndarray) -> pd.DataFrame:
+        """``cut_slabs`` / ``cut_sq_ft`` / ``cut_serials`` for every row (NaN / "" when no plan)."""
+        with instrument.stage("cut_plan"):
+            required = np.broadcast_to(np.asarray(sq, dtype=float) * WASTE_FACTOR, (len(df),))
+            plans = [self.plan(g, r) for g, r in zip(df["serial_group"].tolist(), required.tolist())]
+        return pd.DataFrame(
+            {
+                "cut_slabs": [np.nan if p is None else p.slabs for p in plans],
+                "cut_sq_ft": [np.nan if p is None else p.sq_ft for p in plans],
+                "cut_serials": ["" if p is None else ", ".join(p.serials) for p in plans],
+            },
+            index=df.index,
+        )
+
@@ -1,35 +1,468 @@
+import csv
+import hashlib
+import io
 import json
+import os
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, BinaryIO, Callable, Mapping
+
+import numpy as np
 import pandas as pd
-import gspread
-import streamlit as st
+from pandas.api.types import union_categoricals
 
+from src import instrument
+from src.cache import Snapshot, SnapshotCache
+from src.fetch import ConditionalLoader
+from src.snapshot_store import load_frame_snapshot, save_frame_snapshot
 
-def load_salespeople_sheet(spreadsheet_id: str, tab_name: str) -> pd.DataFrame:
-    """Load a tab from a Google Sheet into a DataFrame."""
-    try:
-        raw = st.secrets["gcp_service_account"]
-        creds = json.loads(raw) if isinstance(raw, str) else raw
-        gc = gspread.service_account_from_dict(creds)
-        ws = gc.open_by_key(spreadsheet_id).worksheet(tab_name)
-        df = pd.DataFrame(ws.get_all_records())
-        df.columns = df.columns.str.strip()
-        return df
-    except Exception as e:
-        st.error(f"❌ Could not load Google Sheet tab '{tab_name}': {e}")
-        return pd.DataFrame()
-
-
-def load_inventory_csv(url: str) -> pd.DataFrame:
-    """Fetch inventory data from a CSV URL."""
-    try:
-        df = pd.read_csv(url)
-        df.columns = df.columns.str.strip()
-        return df
-    except Exception as e:
-        st.error(f"❌ Could not fetch inventory CSV: {e}")
-        return pd.DataFrame()
+# --- Branch → material source locations ---
+BRANCH_TO_MATERIAL_SOURCES = {
+    "Vernon":    ["Vernon", "Abbotsford"],
+    "Victoria":  ["Vernon", "Abbotsford"],
+    "Vancouver": ["Vernon", "Abbotsford"],
+    "Calgary":   ["Edmonton", "Saskatoon"],
+    "Edmonton":  ["Edmonton", "Saskatoon"],
+    "Saskatoon": ["Edmonton", "Saskatoon"],
+    "Winnipeg":  ["Edmonton", "Saskatoon"],
+}
+
+# --- Salespeople sheet ---
+SPREADSHEET_ID = "166G-39R1YSGTjlJLulWGrtE-Reh97_F__EcMlLPa1iQ"
+SALESPEOPLE_TAB = "Salespeople"
+SALESPEOPLE_TTL_SECONDS = 600
+
+# --- Inventory source ---
+INVENTORY_CSV_URL = (
+    "https://docs.google.com/spreadsheets/d/e/"
+    "2PACX-1vRzPf_DEc7ojcjqCsk_5O9HtSFWy7aj2Fi_bPjUh6HVaN38coQSINDps0RGrpiM9ox58izhsNkzD51j/"
+    "pub?output=csv"
+)
+INVENTORY_TTL_SECONDS = 300  # serve the cached snapshot, refresh in background after this
+# Last normalized inventory, kept on disk for instant cold starts (shared by the app and API).
+INVENTORY_SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "inventory.parquet"
+)
+# Bump whenever normalize_inventory_df / INVENTORY_COLUMNS change shape or meaning,
+# so snapshots written by older code are ignored.
+INVENTORY_SCHEMA_VERSION = 3
 
 
 def get_fab_plant(branch: str) -> str:
-    """If branch is one of (Vernon, Victoria, Vancouver), return 'Abbotsford'; else 'Saskatoon'."""
     return "Abbotsford" if branch in ["Vernon", "Victoria", "Vancouver"] else "Saskatoon"
+
+
+@dataclass(frozen=True, eq=False)
+class TransferRoutes:
+    """Per-slab cost and lead days to move slabs from a location to a fab plant.
+
+    Built once from config by ``parse_transfer_routes`` and shared read-only.
+    ``key`` hashes the config, so memos of transfer-dependent results can
+    include it and go stale when the routes change.
+    """
+
+    routes: Mapping[tuple[str, str], tuple[float, int]]
+    default: tuple[float, int]
+    key: str
+
+    def route(self, location: str, fab_plant: str) -> tuple[float, int]:
+        if location == fab_plant:
+            return 0.0, 0
+        return self.routes.get((location, fab_plant), self.default)
+
+
+def parse_transfer_routes(config: Mapping[str, Any] | None) -> TransferRoutes:
+    """Transfer routes from ``config`` (None: no route is charged or delayed).
+
+    ``config`` is ``{"routes": [{"from": ..., "to": ..., "cost_per_slab": ...,
+    "lead_days": ...}, ...], "default": {"cost_per_slab": ..., "lead_days": ...}}``;
+    ``default`` applies to unlisted routes between different locations. Raises
+    ValueError for a malformed config.
+    """
+    config = config or {}
+
+    def route(entry) -> tuple[float, int]:
+        return float(entry.get("cost_per_slab", 0) or 0), int(entry.get("lead_days", 0) or 0)
+
+    try:
+        routes = {(str(r["from"]).strip(), str(r["to"]).strip()): route(r) for r in config.get("routes", ())}
+        default = route(config.get("default") or {})
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise ValueError(f"invalid transfer route config: {e!r}") from e
+    key = hashlib.sha1(json.dumps([sorted(routes.items()), default]).encode()).hexdigest()
+    return TransferRoutes(MappingProxyType(routes), default, key)
+
+
+# No transfer is charged or delayed until routes are configured (the TRANSFER_ROUTES
+# secret, or --transfer-routes for the quote API): a route nobody priced adds nothing.
+NO_TRANSFER_ROUTES = parse_transfer_routes(None)
+
+
+@instrument.timed("salespeople_sheet", count_rows=True)
+def load_salespeople_sheet(ws) -> pd.DataFrame:
+    df = pd.DataFrame(ws.get_all_records())
+    if df.empty:
+        raise ValueError("sheet has no rows")
+    df.columns = df.columns.str.strip()
+    df["Branch"] = df["Branch"].astype(str).str.strip().str.title()
+    return df
+
+
+def make_salespeople_cache(open_worksheet: Callable[[], Any], ttl: float) -> SnapshotCache:
+    """Salespeople tab behind a stale-while-revalidate cache.
+
+    ``open_worksheet`` is called on first load and again only after a failed read.
+    """
+    ws = None
+
+    def load() -> pd.DataFrame:
+        nonlocal ws
+        if ws is None:
+            ws = open_worksheet()
+        try:
+            return load_salespeople_sheet(ws)
+        except Exception:
+            ws = None
+            raise
+
+    return SnapshotCache(load, ttl=ttl, name="salespeople")
+
+
+# Raw CSV columns the app uses; everything else in the export is skipped at parse time.
+INVENTORY_CSV_COLUMNS = {
+    "Brand", "Color", "Thickness", "Location", "Serial Number",
+    "Available Qty", "Available Sq Ft", "Serialized Unit Cost", "Serialized On Hand Cost",
+}
+# Low-cardinality text is parsed straight into categoricals. Quantities and costs
+# are left to to_numeric (they may carry "$" / "," or junk) and stay float64:
+# unit_cost is derived (on-hand cost / sq ft), and float32 would move quotes by cents.
+INVENTORY_CSV_DTYPES = {c: "category" for c in ("Brand", "Color", "Thickness", "Location")}
+# Rows per parse chunk when streaming an export: ingestion holds one chunk of raw
+# rows plus the normalized rows kept so far, however large the export grows.
+INVENTORY_CSV_CHUNK_ROWS = 50_000
+
+
+@instrument.timed("parse", count_rows=True)
+def parse_inventory_csv(data: bytes) -> pd.DataFrame:
+    return pd.read_csv(
+        io.BytesIO(data),
+        usecols=lambda c: str(c).strip() in INVENTORY_CSV_COLUMNS,
+        dtype=INVENTORY_CSV_DTYPES,
+    )
+
+
+def validate_inventory_header(columns: list[str]) -> None:
+    """Raise ValueError unless the export has the columns normalize_inventory_df needs."""
+    found = set(columns)
+    missing = [f"'{c}'" for c in ("Location", "Serial Number") if c not in found]
+    if not found & {"Available Qty", "Available Sq Ft"}:
+        missing.append("'Available Qty' or 'Available Sq Ft'")
+    if not found & {"Serialized Unit Cost", "Serialized On Hand Cost"}:
+        missing.append("'Serialized Unit Cost' or 'Serialized On Hand Cost'")
+    if missing:
+        raise ValueError(
+            f"Could not find {', '.join(missing)} in the inventory CSV. Columns found: {columns}"
+        )
+
+
+def check_inventory_csv_head(head: bytes) -> None:
+    """Validate the header line at the start of an export while the rest downloads."""
+    line = head.split(b"\n", 1)[0].decode("utf-8-sig", errors="replace")
+    names = [c.strip() for c in next(csv.reader([line]), [])]
+    if not any(names):
+        raise ValueError("inventory CSV is empty")
+    validate_inventory_header(names)
+
+
+@instrument.timed("ingest")
+def read_inventory_csv(stream: BinaryIO, chunksize: int = INVENTORY_CSV_CHUNK_ROWS) -> pd.DataFrame:
+    """Parse and normalize an inventory export chunk by chunk (``INVENTORY_COLUMNS`` only).
+
+    The header is validated before any row is read. Each chunk is normalized
+    on its own, dropping rows without stock or cost before the next one is
+    parsed. Row labels and categories come out as from a whole-file parse.
+    """
+    names = [c.strip() for c in next(csv.reader([stream.readline().decode("utf-8-sig")]), [])]
+    if not any(names):
+        raise ValueError("inventory CSV is empty")
+    validate_inventory_header(names)
+    usecols = [i for i, c in enumerate(names) if c in INVENTORY_CSV_COLUMNS and names.index(c) == i]
+
+    parts, raw_rows = [], 0
+    reader = pd.read_csv(
+        stream,
+        header=None,
+        names=[names[i] for i in usecols],
+        usecols=usecols,
+        dtype=INVENTORY_CSV_DTYPES,
+        chunksize=chunksize,
+    )
+    with reader:
+        try:
+            for chunk in reader:
+                raw_rows += len(chunk)
+                part = normalize_inventory_df(chunk)[INVENTORY_COLUMNS]
+                if len(part) or not parts:
+                    parts.append(part)
+        except pd.errors.EmptyDataError:
+            pass
+    if not raw_rows:
+        raise ValueError("inventory CSV is empty")
+    df = _concat_chunks(parts)
+    instrument.rows("parse", raw_rows)
+    instrument.rows("normalize", len(df))
+    return df
+
+
+def _concat_chunks(parts: list[pd.DataFrame]) -> pd.DataFrame:
+    """Stack normalized chunks; categoricals get the sorted union of their categories."""
+    if len(parts) == 1:
+        return parts[0]
+    cols = {}
+    for c, s in parts[0].items():
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            cols[c] = union_categoricals([p[c] for p in parts], sort_categories=True)
+        else:
+            pieces = [p[c] for p in parts]
+            # A column that is numeric in some chunks and text in others is text as a whole.
+            if not all(pd.api.types.is_numeric_dtype(x) for x in pieces) and len({x.dtype for x in pieces}) > 1:
+                pieces = [x if pd.api.types.is_string_dtype(x) else x.astype(str) for x in pieces]
+            cols[c] = pd.concat(pieces).array
+    index = parts[0].index.append([p.index for p in parts[1:]])
+    return pd.DataFrame(cols, index=index, copy=False)
+
+
+def load_normalized_inventory(data: bytes | BinaryIO) -> pd.DataFrame:
+    """Frozen normalized inventory from CSV bytes or a binary stream (read once, in chunks)."""
+    return freeze_frame(read_inventory_csv(io.BytesIO(data) if isinstance(data, bytes) else data))
+
+
+def freeze_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Read-only view of ``df`` for sharing across sessions and threads (no data copied).
+
+    NumPy-backed columns and categorical codes are re-wrapped as non-writeable
+    views, so an in-place write raises instead of changing the shared
+    snapshot; Arrow-backed columns are immutable already. Frames derived from
+    it (filters, new columns, ``copy()``) are ordinary writable frames.
+    """
+    cols = {}
+    for name, s in df.items():
+        values = s.array
+        if isinstance(values, pd.Categorical):
+            codes = values.codes.view()
+            codes.flags.writeable = False
+            cols[name] = pd.Categorical.from_codes(codes, dtype=values.dtype, validate=False)
+        elif isinstance(s.dtype, np.dtype):
+            arr = s.to_numpy().view()
+            arr.flags.writeable = False
+            cols[name] = arr
+        else:
+            cols[name] = s
+    return pd.DataFrame(cols, index=df.index, copy=False)
+
+
+def validate_inventory_snapshot(snapshot: tuple[pd.DataFrame, str]) -> None:
+    df, _ = snapshot
+    if df.empty:
+        raise ValueError("inventory CSV has no rows with stock and cost")
+    for name, dtype in INVENTORY_NUMERIC_DTYPES.items():
+        if df[name].dtype != dtype:
+            raise ValueError(f"inventory column {name!r} is {df[name].dtype}, expected {dtype}")
+
+
+def make_inventory_cache(url: str, ttl: float, snapshot_path: str) -> SnapshotCache:
+    """Normalized inventory behind a stale-while-revalidate cache.
+
+    Seeded from the on-disk snapshot when one exists, so a cold start serves
+    immediately while the sheet is revalidated in the background.
+    """
+    # Conditional GETs: an unchanged sheet costs one 304 round trip and no parsing.
+    # A 200 with the same bytes is not re-parsed; a bad header stops the download.
+    loader = ConditionalLoader(url, parse=load_normalized_inventory, check_head=check_inventory_csv_head)
+    seed = None
+    saved_hash = [None]
+    stored = load_frame_snapshot(snapshot_path, INVENTORY_SCHEMA_VERSION)
+    if stored is not None:
+        try:
+            validate_inventory_snapshot((stored.frame, stored.content_hash))
+        except (KeyError, ValueError):
+            stored = None  # written by a different normalization: refetch instead
+    if stored is not None:
+        frame = freeze_frame(stored.frame)
+        loader.seed(frame, stored.content_hash)
+        seed = Snapshot(value=(frame, stored.content_hash), fetched_at=stored.saved_at)
+        saved_hash[0] = stored.content_hash
+
+    def persist(snap: Snapshot) -> None:
+        df, content_hash = snap.value
+        if content_hash != saved_hash[0]:
+            save_frame_snapshot(
+                snapshot_path, df, content_hash, INVENTORY_SCHEMA_VERSION, saved_at=snap.fetched_at
+            )
+            saved_hash[0] = content_hash
+
+    return SnapshotCache(
+        loader.load,
+        ttl=ttl,
+        validate=validate_inventory_snapshot,
+        name="inventory",
+        seed=seed,
+        on_update=persist,
+    )
+
+
+# Columns of the normalized inventory that later stages read (and the snapshot stores).
+INVENTORY_COLUMNS = [
+    "Brand", "Color", "Thickness", "Thickness_norm", "Full Name",
+    "Location", "Serial Number", "Available Sq Ft", "unit_cost",
+]
+# Numeric columns must come out float64: an object column here (e.g. from pd.NA)
+# is several times larger and slows every aggregation downstream.
+INVENTORY_NUMERIC_DTYPES = {"Available Sq Ft": np.dtype("float64"), "unit_cost": np.dtype("float64")}
+
+
+@instrument.timed("normalize", count_rows=True)
+def normalize_inventory_df(df: pd.DataFrame) -> pd.DataFrame:
+    """Clean, derived columns on a new frame; ``df`` itself is never modified."""
+    # New frame over the same column data: assignments below never reach the caller's frame.
+    df = pd.DataFrame({str(c).strip(): s for c, s in df.items()}, index=df.index, copy=False)
+
+    # Available Sq Ft
+    if "Available Qty" in df.columns:
+        df["Available Sq Ft"] = pd.to_numeric(df["Available Qty"], errors="coerce").astype("float64")
+    elif "Available Sq Ft" in df.columns:
+        df["Available Sq Ft"] = pd.to_numeric(df["Available Sq Ft"], errors="coerce").astype("float64")
+    else:
+        raise ValueError(
+            "Could not find either 'Available Qty' or 'Available Sq Ft' in the inventory CSV. "
+            f"Columns found: {df.columns.tolist()}"
+        )
+
+    # Unit Cost (per sq ft)
+    if "Serialized Unit Cost" in df.columns:
+        df["unit_cost"] = pd.to_numeric(
+            df["Serialized Unit Cost"].astype(str).str.replace(r"[\$,]", "", regex=True),
+            errors="coerce",
+        ).astype("float64")
+    elif "Serialized On Hand Cost" in df.columns:
+        df["SerialOnHandCost"] = pd.to_numeric(
+            df["Serialized On Hand Cost"].astype(str).str.replace(r"[\$,]", "", regex=True),
+            errors="coerce",
+        )
+        # NaN (not pd.NA) for empty slabs keeps the quotient float64.
+        denom = df["Available Sq Ft"].where(df["Available Sq Ft"] > 0)
+        df["unit_cost"] = (df["SerialOnHandCost"] / denom).astype("float64")
+    else:
+        raise ValueError(
+            "Could not find 'Serialized Unit Cost' or 'Serialized On Hand Cost' in the inventory CSV. "
+            f"Columns found: {df.columns.tolist()}"
+        )
+
+    # Basic filtering
+    df = df[
+        df["Available Sq Ft"].notna() & (df["Available Sq Ft"] > 0)
+        & df["unit_cost"].notna() & (df["unit_cost"] > 0)
+    ]
+
+    # Clean text fields (as categoricals: string work happens once per distinct value)
+    for c in ["Brand", "Color", "Thickness"]:
+        if c in df.columns:
+            df[c] = _recode_categorical(df[c], lambda v: v.str.strip())
+        else:
+            df[c] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), [""])
+    df["Location"] = _recode_categorical(df["Location"], lambda v: v)
+
+    df["Full Name"] = _join_categoricals(df["Brand"], df["Color"], " - ")
+
+    # Normalize thickness for robust matching (e.g., "3 cm" => "3cm")
+    df["Thickness_norm"] = _recode_categorical(
+        df["Thickness"], lambda v: v.str.lower().str.replace(" ", "", regex=False)
+    )
+
+    return df
+
+
+def _recode_categorical(s: pd.Series, transform) -> pd.Series:
+    """Apply ``transform`` to the distinct labels of ``s``; merge labels that collide.
+
+    Categories come out sorted, so groupby/sort order matches plain strings.
+    """
+    cat = s.astype("category")
+    labels = transform(pd.Index(cat.cat.categories.astype(str))).to_numpy(dtype=object)
+    uniq, inverse = np.unique(labels, return_inverse=True)
+    codes = cat.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, inverse[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, uniq), index=s.index, name=s.name)
+
+
+def _join_categoricals(a: pd.Series, b: pd.Series, sep: str) -> pd.Series:
+    """Categorical of ``a + sep + b`` built from category codes (one string per distinct pair)."""
+    a_codes = a.cat.codes.to_numpy().astype(np.int64)
+    b_codes = b.cat.codes.to_numpy().astype(np.int64)
+    n_b = max(len(b.cat.categories), 1)
+    valid = (a_codes >= 0) & (b_codes >= 0)
+    pairs, pair_inverse = np.unique(a_codes[valid] * n_b + b_codes[valid], return_inverse=True)
+    names = (
+        a.cat.categories.to_numpy(dtype=object)[pairs // n_b]
+        + sep
+        + b.cat.categories.to_numpy(dtype=object)[pairs % n_b]
+    )
+    uniq, name_inverse = np.unique(names, return_inverse=True)
+    codes = np.full(len(a), -1, dtype=np.int64)
+    codes[valid] = name_inverse[pair_inverse]
+    return pd.Series(pd.Categorical.from_codes(codes, uniq), index=a.index)
+
+
+# Aggregation grain: one option per material per location per thickness.
+AGGREGATE_KEYS = ["Thickness_norm", "Full Name", "Location"]
+
+
+@instrument.timed("aggregate", count_rows=True)
+def aggregate_inventory(df: pd.DataFrame) -> pd.DataFrame:
+    # Group within thickness + location (to respect transfers); rows come out
+    # ordered by Full Name, then Location, within each thickness. Only built-in
+    # reductions here: serial lists come from SerialIndex, keyed by serial_group.
+    agg = (
+        df.groupby(AGGREGATE_KEYS, observed=True)
+        .agg(
+            available_sq_ft=("Available Sq Ft", "sum"),
+            unit_cost=("unit_cost", "mean"),
+            slab_count=("Serial Number", "nunique"),
+        )
+        .reset_index()
+    )
+    agg["serial_group"] = np.arange(len(agg), dtype=np.int32)
+    return agg
+
+
+class SerialIndex:
+    """Serial numbers (and slab areas) of each aggregated option, built once per snapshot.
+
+    Construction only groups row positions (integer work); the sorted,
+    comma-joined list is produced on demand for the options actually shown
+    or emailed. ``get(serial_group)`` / ``slabs(serial_group)`` match the row
+    order of ``aggregate_inventory`` on the same frame.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        groups = df.groupby(AGGREGATE_KEYS, observed=True).ngroup().to_numpy()
+        keep = groups >= 0  # rows with a missing key are not in any option
+        groups = groups[keep].astype(np.int64)
+        order = np.argsort(groups, kind="stable")
+        self._serials = df["Serial Number"].to_numpy()[keep][order]
+        self._areas = df["Available Sq Ft"].to_numpy(dtype=float)[keep][order]
+        n_groups = int(groups.max()) + 1 if len(groups) else 0
+        self._offsets = np.searchsorted(groups[order], np.arange(n_groups + 1))
+
+    def get(self, serial_group: int) -> str:
+        lo, hi = self._offsets[serial_group], self._offsets[serial_group + 1]
+        serials = pd.Series(self._serials[lo:hi]).dropna()  # missing serials aren't slabs (cf. nunique)
+        return ", ".join(sorted(serials.astype(str).unique()))
+
+    def slabs(self, serial_group: int) -> tuple[np.ndarray, np.ndarray]:
+        """Distinct serials of an option (as str) and each slab's sq ft (rows of a serial summed)."""
+        lo, hi = self._offsets[serial_group], self._offsets[serial_group + 1]
+        serials = self._serials[lo:hi]
+        known = ~pd.isna(serials)
+        uniq, inverse = np.unique(serials[known].astype(str), return_inverse=True)
+        return uniq, np.bincount(inverse, weights=self._areas[lo:hi][known], minlength=len(uniq))
@@ -1,154 +1,216 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import functools
+import math
+from datetime import datetime
 from urllib.parse import quote
+from zoneinfo import ZoneInfo
 
-import pandas as pd
-import pytz
-import streamlit as st
+from src import instrument
+from src.money import money
 
 
-def compose_breakdown_email_body(
-    job_name: str,
-    selected_branch: str,
-    selected_salesperson: str,
-    rec: dict,
-    costs: dict,
-    fab_plant: str,
-    selected_thickness: str,
-    sq_ft_used: float,
-    additional_costs: float,
-    subtotal: float,
-    gst_amount: float,
-    final_total: float,
-) -> str:
-    def fmt(v):
-        return f"${v:,.2f}"
-
-    tz = pytz.timezone("America/Vancouver")
-    now = pd.Timestamp.now(tz=tz).strftime("%Y-%m-%d %H:%M:%S %Z")
-    job = job_name or "Unnamed Job"
-
-    transfer_button_html = ""
-    if rec.get("Location") != fab_plant:
-        try:
-            to_email = st.secrets["TRANSFER_REQUEST_EMAIL"]
-            subject = f"Slab Transfer Request - Job: {job}"
-            body = f"""
-Please initiate a transfer for the following slab(s):
-
-PO:
-JOB LINK:
+def parse_email_list(s: str | None) -> list[str]:
+    if not s:
+        return []
+    parts = [p.strip() for p in s.replace(";", ",").split(",")]
+    return [p for p in parts if p]
 
-Job Name: {job}
-Material: {rec.get("Full Name", "N/A")}
-Serial Number(s): {rec.get("serial_numbers", "N/A")}
-FROM (Current Location): {rec.get("Location", "N/A")}
-TO (Fabrication Plant): {fab_plant}
 
-Thank you,
-{selected_salesperson}
-"""
-            mailto_link = f"mailto:{to_email}?subject={quote(subject)}&body={quote(body)}"
-            transfer_button_html = f"""
-<p style="text-align: center; margin-top: 25px;">
-  <a href="{mailto_link}" target="_blank" style="background-color: #2563eb; color: white; padding: 12px 20px; text-decoration: none; border-radius: 5px; font-size: 16px;">
-    Request Slab Transfer
-  </a>
-</p>
-<p style="text-align: center; font-size: 12px; color: #666;">
-  (Material is at a different location from the fabrication plant)
-</p>
-"""
-        except KeyError:
-            transfer_button_html = "<p style='color: red; text-align: center;'>Could not create transfer button: 'TRANSFER_REQUEST_EMAIL' secret is missing.</p>"
+_QUOTE_TZ = ZoneInfo("America/Vancouver")
 
-    return f"""<html>
+# Static part of every quote: document head and CSS, rendered once at import.
+_QUOTE_HEAD = """<html>
 <head><style>
-  body {{ font-family: Arial, sans-serif; color: #333; }}
-  .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-  h1 {{ color: #0056b3; margin-bottom: 4px; }}
-  p.meta {{ margin: 0; font-size: 0.9rem; color: #555; }}
-  h2 {{ color: #0056b3; border-bottom: 1px solid #eee; padding-bottom: 5px; margin-top: 20px; }}
-  table {{ width: 100%; border-collapse: collapse; margin: 10px 0; }}
-  th, td {{ padding: 8px; text-align: left; border-bottom: 1px solid #ddd; }}
-  th {{ background: #f0f0f0; }}
-  .grand-total-row td {{ font-weight: bold; background: #c9e0ff; font-size: 1rem; }}
-  .footer {{ font-size: 10px; color: #666; text-align: center; margin-top: 20px; }}
+  body { font-family: Arial, sans-serif; color: #333; }
+  .container { max-width: 640px; margin: 0 auto; padding: 20px; }
+  h1 { color: #0056b3; margin-bottom: 4px; }
+  p.meta { margin: 0; font-size: 0.9rem; color: #555; }
+  h2 { color: #0056b3; border-bottom: 1px solid #eee; padding-bottom: 5px; margin-top: 20px; }
+  table { width: 100%; border-collapse: collapse; margin: 10px 0; }
+  th, td { padding: 8px; text-align: left; border-bottom: 1px solid #ddd; }
+  th { background: #f0f0f0; }
+  .grand-total-row td { font-weight: bold; background: #c9e0ff; font-size: 1rem; }
+  .footer { font-size: 10px; color: #666; text-align: center; margin-top: 20px; }
 </style></head>
-<body>
+"""
+
+# Per-quote fields; money values arrive pre-formatted.
+_QUOTE_BODY = """<body>
   <div class="container">
     <h1>CounterPro Estimate</h1>
     <p class="meta">
-      <strong>Branch:</strong> {selected_branch} &nbsp;&nbsp;
-      <strong>Salesperson:</strong> {selected_salesperson}
+      <strong>Branch:</strong> {branch} &nbsp;&nbsp;
+      <strong>Salesperson:</strong> {salesperson}
     </p>
 
     <h2>Project &amp; Material Overview</h2>
     <table>
       <tr><th>Detail</th><th>Value</th></tr>
       <tr><td>Job Name:</td><td>{job}</td></tr>
-      <tr><td>Slab Selected:</td><td>{rec.get("Full Name", "N/A")}</td></tr>
-      <tr><td>Material Source:</td><td>{rec.get("Location", "N/A")}</td></tr>
+      <tr><td>Slab Selected:</td><td>{material}</td></tr>
+      <tr><td>Material Source:</td><td>{location}</td></tr>
       <tr><td>Fabrication Plant:</td><td>{fab_plant}</td></tr>
-      <tr><td>Thickness:</td><td>{selected_thickness}</td></tr>
+      <tr><td>Thickness:</td><td>{thickness}</td></tr>
       <tr><td>Sq Ft (for pricing):</td><td>{sq_ft_used} sq.ft</td></tr>
-      <tr><td>Slab Sq Ft (Total):</td><td>{rec.get("available_sq_ft", 0):.2f} sq.ft</td></tr>
-      <tr><td>Unique Slabs:</td><td>{rec.get("slab_count", 0)}</td></tr>
-      <tr><td>Serial Numbers:</td><td>{rec.get("serial_numbers", "N/A")}</td></tr>
+      <tr><td>Slab Sq Ft (Total):</td><td>{slab_sq_ft:.2f} sq.ft</td></tr>
+      <tr><td>Unique Slabs:</td><td>{slab_count}</td></tr>
+      <tr><td>Serial Numbers:</td><td>{serial_numbers}</td></tr>
     </table>
 
     <h2>Cost Components</h2>
     <table>
       <tr><th>Component</th><th>Amount</th></tr>
-      <tr><td>Material &amp; Fabrication:</td><td>{fmt(costs["base_material_and_fab_component"])} </td></tr>
-      <tr><td>Installation:</td><td>{fmt(costs["base_install_cost_component"])} </td></tr>
-      <tr><td>IB Cost (Internal):</td><td>{fmt(costs["ib_cost_component"])} </td></tr>
+      <tr><td>Material &amp; Fabrication:</td><td>{material_and_fab}</td></tr>
+      <tr><td>Installation:</td><td>{install}</td></tr>
+      {transfer_row}
+      <tr><td>IB Cost (Internal):</td><td>{ib_cost}</td></tr>
     </table>
 
     <h2>Totals</h2>
     <table>
       <tr><th>Description</th><th>Amount</th></tr>
-      <tr><td>Base Estimate:</td><td>{fmt(costs["total_customer_facing_base_cost"])} </td></tr>
-      <tr><td>Additional Costs (sinks, tile, plumbing):</td><td>{fmt(additional_costs)} </td></tr>
-      <tr><td>Subtotal:</td><td>{fmt(subtotal)} </td></tr>
-      <tr><td>GST (5%):</td><td>{fmt(gst_amount)} </td></tr>
-      <tr class="grand-total-row"><td>Final Total:</td><td>{fmt(final_total)} </td></tr>
+      <tr><td>Base Estimate:</td><td>{base_estimate}</td></tr>
+      <tr><td>Additional Costs (sinks, tile, plumbing):</td><td>{additional_costs}</td></tr>
+      <tr><td>Subtotal:</td><td>{subtotal}</td></tr>
+      <tr><td>GST ({gst_pct:.0f}%):</td><td>{gst_amount}</td></tr>
+      {pst_row}
+      <tr class="grand-total-row"><td>Final Total:</td><td>{final_total}</td></tr>
     </table>
 
-    {transfer_button_html}
-
+    {transfer_button}
     <div class="footer">Generated by CounterPro on {now}</div>
   </div>
 </body>
 </html>"""
 
+_PST_ROW = """
+        <tr>
+            <td>{name} ({pct:.0f}%):</td>
+            <td>{amount}</td>
+        </tr>
+        """
+
+_TRANSFER_ROW = """<tr><td>Slab Transfer (+{lead_days} days):</td><td>{amount}</td></tr>"""
+
+_TRANSFER_BODY = """
+Please initiate a transfer for the following slab(s):
 
-def send_email(subject: str, body: str, to_email: str):
+PO: 
+JOB LINK: 
+
+Job Name: {job}
+Material: {material}
+Serial Number(s): {serial_numbers}
+
+FROM (Current Location): {location}
+TO (Fabrication Plant): {fab_plant}
+
+Thank you,
+{salesperson}
+            """
+
+_TRANSFER_BUTTON = """
+<p style="text-align: center; margin-top: 25px;">
+  <a href="{mailto_link}" target="_blank" style="background-color: #2563eb; color: white; padding: 12px 20px; text-decoration: none; border-radius: 5px; font-size: 16px;">
+    Request Slab Transfer
+  </a>
+</p>
+<p style="text-align: center; font-size: 12px; color: #666;">
+  (Material is at a different location from the fabrication plant)
+</p>
+            """
+
+
+@functools.lru_cache(maxsize=256)
+def _transfer_button_html(
+    to_display: str, job: str, material, serial_numbers, location, fab_plant: str, salesperson: str
+) -> str:
+    """Transfer-request ``mailto`` button; URL-quoting is the expensive part, so it's memoized."""
+    subject = f"Slab Transfer Request - Job: {job}"
+    body = _TRANSFER_BODY.format(
+        job=job, material=material, serial_numbers=serial_numbers,
+        location=location, fab_plant=fab_plant, salesperson=salesperson,
+    )
+    mailto_link = f"mailto:{quote(to_display)}?subject={quote(subject)}&body={quote(body)}"
+    return _TRANSFER_BUTTON.format(mailto_link=mailto_link)
+
+
+@instrument.timed("email_render")
+def compose_breakdown_email_body(
+    job_name: str,
+    selected_branch: str,
+    selected_salesperson: str,
+    rec: dict,
+    costs: dict,
+    fab_plant: str,
+    selected_thickness: str,
+    sq_ft_used: float,
+    additional_costs: float,
+    subtotal: float,
+    tax_info: dict,
+    final_total: float,
+    transfer_emails: list[str] | None = None,
+    generated_at: datetime | None = None,
+) -> str:
+    """Quote HTML (download + email). ``generated_at`` defaults to now, Vancouver time."""
+    now = (generated_at or datetime.now(_QUOTE_TZ)).strftime("%Y-%m-%d %H:%M:%S %Z")
+    job = job_name or "Unnamed Job"
+
+    # Transfer request button (supports multiple recipients)
+    transfer_button_html = ""
     try:
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = st.secrets["SENDER_FROM_EMAIL"]
-        msg["To"] = to_email
-        msg.attach(MIMEText(body, "html"))
-
-        recipients = [to_email]
-        cc = st.secrets.get("QUOTE_TRACKING_CC_EMAIL")
-        if cc:
-            msg["Cc"] = cc
-            recipients.append(cc)
-
-        with smtplib.SMTP(
-            st.secrets["SMTP_SERVER"],
-            st.secrets["SMTP_PORT"],
-        ) as server:
-            server.starttls()
-            server.login(
-                st.secrets["EMAIL_USER"],
-                st.secrets["EMAIL_PASSWORD"],
+        to_display = ",".join(transfer_emails) if transfer_emails else ""
+        if rec.get("Location") != fab_plant and to_display:
+            transfer_button_html = _transfer_button_html(
+                to_display, job, rec.get("Full Name", "N/A"), rec.get("serial_numbers", "N/A"),
+                rec.get("Location", "N/A"), fab_plant, selected_salesperson,
             )
-            server.sendmail(msg["From"], recipients, msg.as_string())
-
-        st.success("✅ Quote emailed successfully.")
-    except Exception as e:
-        st.error(f"Email failed: {e}")
+    except Exception:
+        transfer_button_html = "<p style='color: red; text-align: center;'>Could not create transfer button.</p>"
+
+    # With a cut plan the quote describes the slabs it pulls (as Serial Numbers does).
+    slab_sq_ft, slab_count = rec.get("available_sq_ft", 0), rec.get("slab_count", 0)
+    cut_sq_ft = float(rec.get("cut_sq_ft", math.nan))
+    if cut_sq_ft > 0:
+        slab_sq_ft, slab_count = cut_sq_ft, int(rec["cut_slabs"])
+
+    transfer_row_html = ""
+    if costs.get("transfer_cost", 0) > 0:
+        transfer_row_html = _TRANSFER_ROW.format(
+            lead_days=int(rec.get("lead_days", 0) or 0),
+            amount=money(costs["transfer_cost"]),
+        )
+
+    pst_row_html = ""
+    if tax_info.get("pst_amount", 0) > 0:
+        pst_row_html = _PST_ROW.format(
+            name=tax_info.get("pst_name", "PST"),
+            pct=tax_info.get("pst_rate", 0) * 100,
+            amount=money(tax_info["pst_amount"]),
+        )
+
+    return _QUOTE_HEAD + _QUOTE_BODY.format(
+        branch=selected_branch,
+        salesperson=selected_salesperson,
+        job=job,
+        material=rec.get("Full Name", "N/A"),
+        location=rec.get("Location", "N/A"),
+        fab_plant=fab_plant,
+        thickness=selected_thickness,
+        sq_ft_used=sq_ft_used,
+        slab_sq_ft=slab_sq_ft,
+        slab_count=slab_count,
+        serial_numbers=rec.get("serial_numbers", "N/A"),
+        material_and_fab=money(costs["base_material_and_fab_component"]),
+        install=money(costs["base_install_cost_component"]),
+        transfer_row=transfer_row_html,
+        ib_cost=money(costs["ib_cost_component"]),
+        base_estimate=money(costs["total_customer_facing_base_cost"]),
+        additional_costs=money(additional_costs),
+        subtotal=money(subtotal),
+        gst_pct=tax_info.get("gst_rate", 0) * 100,
+        gst_amount=money(tax_info.get("gst_amount", 0)),
+        pst_row=pst_row_html,
+        final_total=money(final_total),
+        transfer_button=transfer_button_html,
+        now=now,
+    )
@@ -0,0 +1,104 @@
+import functools
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Iterator
+
+_current: ContextVar["Recorder | None"] = ContextVar("instrument_recorder", default=None)
+_NOOP = nullcontext()
+
+
+class Recorder:
+    """Stage durations, cache hit/miss counts and row counts for one run (e.g. one rerun).
+
+    Code under measurement calls the module-level helpers (``stage``, ``timed``,
+    ``cache_event``, ``rows``), which record into the recorder activated for the
+    current context. With none active they cost a single ContextVar lookup.
+    Stages may nest; each name accumulates its own wall time and call count.
+    """
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.stages: dict[str, list[float]] = {}  # name -> [seconds, calls]
+        self.cache: dict[str, dict[str, int]] = {}
+        self.rows: dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += time.perf_counter() - start
+            entry[1] += 1
+
+    def cache_event(self, name: str, hit: bool) -> None:
+        counts = self.cache.setdefault(name, {"hit": 0, "miss": 0})
+        counts["hit" if hit else "miss"] += 1
+
+    def report(self) -> dict:
+        return {
+            "label": self.label,
+            "started_at": self.started_at,
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 3),
+            "stages": {
+                name: {"ms": round(seconds * 1000, 3), "calls": calls}
+                for name, (seconds, calls) in self.stages.items()
+            },
+            "cache": self.cache,
+            "rows": self.rows,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.report(), separators=(",", ":"))
+
+
+def activate(recorder: Recorder | None) -> Token:
+    """Make ``recorder`` current for this context (``None`` turns recording off)."""
+    return _current.set(recorder)
+
+
+def current() -> Recorder | None:
+    return _current.get()
+
+
+def stage(name: str):
+    """Context manager timing ``name`` on the current recorder (no-op when none)."""
+    rec = _current.get()
+    return _NOOP if rec is None else rec.stage(name)
+
+
+def cache_event(name: str, hit: bool) -> None:
+    rec = _current.get()
+    if rec is not None:
+        rec.cache_event(name, hit)
+
+
+def rows(name: str, n: int) -> None:
+    rec = _current.get()
+    if rec is not None:
+        rec.rows[name] = n
+
+
+def timed(name: str, count_rows: bool = False) -> Callable:
+    """Decorator: time calls as stage ``name``; optionally record ``len(result)`` as its rows."""
+
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs) -> Any:
+            rec = _current.get()
+            if rec is None:
+                return fn(*args, **kwargs)
+            with rec.stage(name):
+                out = fn(*args, **kwargs)
+            if count_rows:
+                rec.rows[name] = len(out)
+            return out
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,190 @@
+import heapq
+import itertools
+import logging
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.message import Message
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+def _is_permanent(e: Exception) -> bool:
+    """5xx replies (bad auth, refused sender/recipients, rejected data) won't succeed on retry."""
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(e, smtplib.SMTPResponseException) and 500 <= e.smtp_code < 600
+
+
+@dataclass(frozen=True)
+class SmtpSettings:
+    host: str
+    port: int
+    user: str
+    password: str
+    starttls: bool = True
+    timeout: float = 30.0
+
+
+@dataclass
+class MailJob:
+    """One queued message and its delivery state (queued, sending, retrying, sent, failed)."""
+
+    id: str
+    message: Message
+    from_addr: str
+    recipients: list[str]
+    status: str = "queued"
+    attempts: int = 0
+    error: str | None = None
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("sent", "failed")
+
+
+class MailDispatcher:
+    """Background SMTP sender with a bounded queue and one long-lived connection.
+
+    ``submit`` returns a ``MailJob`` immediately; the worker updates its status.
+    The worker thread sends whatever is queued back to back over the same
+    authenticated connection, reconnects when the server drops it, retries
+    transient failures with exponential backoff, and closes the connection
+    after ``idle_timeout`` seconds without mail.
+    """
+
+    def __init__(
+        self,
+        settings: SmtpSettings,
+        max_queue: int = 100,
+        max_attempts: int = 4,
+        backoff: float = 2.0,
+        idle_timeout: float = 60.0,
+        history: int = 500,
+        smtp_factory: Callable[..., smtplib.SMTP] = smtplib.SMTP,
+    ):
+        self.settings = settings
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self._smtp_factory = smtp_factory
+        self._queue: queue.Queue[MailJob] = queue.Queue(maxsize=max_queue)
+        self._retries: list[tuple[float, int, MailJob]] = []
+        self._seq = itertools.count()
+        self._jobs: OrderedDict[str, MailJob] = OrderedDict()
+        self._history = history
+        self._lock = threading.Lock()
+        self._conn: smtplib.SMTP | None = None
+        self._thread: threading.Thread | None = None
+
+    # --- public API ---
+
+    def submit(self, message: Message, from_addr: str, recipients: list[str]) -> MailJob:
+        """Queue a message; raises ``queue.Full`` when the backlog is at capacity.
+
+        The returned job is updated in place by the worker as delivery proceeds.
+        """
+        job = MailJob(id=uuid.uuid4().hex, message=message, from_addr=from_addr, recipients=recipients)
+        self._queue.put_nowait(job)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._history:
+                self._jobs.popitem(last=False)
+        self._ensure_worker()
+        return job
+
+    def status(self, job_id: str) -> MailJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    # --- worker ---
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="mail-dispatch", daemon=True)
+                self._thread.start()
+
+    def _next_job(self) -> MailJob | None:
+        now = time.time()
+        if self._retries and self._retries[0][0] <= now:
+            return heapq.heappop(self._retries)[2]
+        timeout = self.idle_timeout
+        if self._retries:
+            timeout = min(timeout, self._retries[0][0] - now)
+        try:
+            return self._queue.get(timeout=max(timeout, 0.0))
+        except queue.Empty:
+            return None
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                if not self._retries:
+                    self._disconnect()  # idle: don't hold the connection open
+                continue
+            self._deliver(job)
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._conn is None:
+            s = self.settings
+            conn = self._smtp_factory(s.host, s.port, timeout=s.timeout)
+            try:
+                if s.starttls:
+                    conn.starttls()
+                conn.login(s.user, s.password)
+            except Exception:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def _disconnect(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.quit()
+            except Exception:
+                conn.close()
+
+    def _deliver(self, job: MailJob) -> None:
+        job.attempts += 1
+        self._set(job, "sending")
+        try:
+            self._send(job)
+        except Exception as e:
+            # Drop the connection so the next attempt starts from a clean session.
+            self._disconnect()
+            if _is_permanent(e) or job.attempts >= self.max_attempts:
+                self._set(job, "failed", e)
+                logger.warning("mail %s failed after %d attempts: %s", job.id, job.attempts, e)
+                return
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            self._set(job, "retrying", e)
+            heapq.heappush(self._retries, (time.time() + delay, next(self._seq), job))
+            return
+        self._set(job, "sent")
+
+    def _send(self, job: MailJob) -> None:
+        reused = self._conn is not None
+        payload = job.message.as_string()
+        try:
+            self._connect().sendmail(job.from_addr, job.recipients, payload)
+        except smtplib.SMTPServerDisconnected:
+            if not reused:
+                raise
+            # The server closed our idle connection; reconnect once without backoff.
+            self._disconnect()
+            self._connect().sendmail(job.from_addr, job.recipients, payload)
+
+    def _set(self, job: MailJob, status: str, error: Exception | None = None) -> None:
+        job.status = status
+        job.error = None if error is None else f"{type(error).__name__}: {error}"
+        job.updated_at = time.time()
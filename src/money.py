@@ -0,0 +1,72 @@
+"""Money as integer cents.
+
+Amounts are rounded to the cent once, half up on the decimal Python prints for
+the float (what ``Decimal(str(x))`` sees), then added as integers, so sums
+never pick up binary-float drift. Arrays are rounded in one NumPy pass; only
+values within float error of a half cent go through Decimal.
+"""
+import math
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+CENT = Decimal("0.01")
+# Relative error of |x| * 100 against the printed decimal is below ~3e-16; anything
+# this close to a half cent is settled exactly by Decimal instead.
+_TIE_TOLERANCE = 1e-12
+# Largest cent count a float holds exactly; arrays treat bigger amounts as invalid.
+_MAX_CENTS = 2.0 ** 53
+
+
+def _decimal_cents(x) -> int:
+    try:
+        return int(Decimal(str(x)).quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+    except Exception:
+        return 0
+
+
+def to_cents(x) -> int:
+    """``x`` dollars as whole cents, rounded half up; 0 for anything that is not a finite number."""
+    if isinstance(x, (int, np.integer)) and not isinstance(x, bool):
+        return int(x) * 100
+    if not isinstance(x, (float, np.floating)):
+        return _decimal_cents(x)
+    scaled = abs(float(x)) * 100
+    if not math.isfinite(scaled):
+        return 0
+    whole = math.floor(scaled)
+    frac = scaled - whole
+    if abs(frac - 0.5) <= _TIE_TOLERANCE * (1 + scaled):
+        return _decimal_cents(x)
+    cents = whole + (frac > 0.5)
+    return -cents if x < 0 else cents
+
+
+def to_cents_array(values) -> np.ndarray:
+    """``to_cents`` over an array of dollar amounts (int64; NaN, inf and |x| ≥ $2**53 / 100 become 0)."""
+    x = np.asarray(values, dtype=float)
+    scaled = np.abs(x) * 100
+    scaled = np.where(scaled < _MAX_CENTS, scaled, 0.0)  # NaN compares False
+    whole = np.floor(scaled)
+    frac = scaled - whole
+    cents = (whole + (frac > 0.5)).astype(np.int64)
+    cents = np.where(x < 0, -cents, cents)
+    for i in np.flatnonzero(np.abs(frac - 0.5) <= _TIE_TOLERANCE * (1 + scaled)).tolist():
+        cents.flat[i] = _decimal_cents(x.flat[i])
+    return cents
+
+
+def round_cents(values) -> np.ndarray:
+    """Dollar amounts rounded to the cent as ``money`` would show them (float64; NaN stays NaN)."""
+    x = np.asarray(values, dtype=float)
+    return np.where(np.isfinite(x), to_cents_array(x) / 100, x)
+
+
+def format_cents(cents: int) -> str:
+    sign = "-" if cents < 0 else ""
+    whole, part = divmod(abs(int(cents)), 100)
+    return f"${sign}{whole:,}.{part:02d}"
+
+
+def money(x) -> str:
+    return format_cents(to_cents(x))
@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.data import freeze_frame
+
+
+@dataclass(frozen=True)
+class OptionSlice:
+    """Aggregated options for one (branch, thickness), sorted by available sq ft."""
+
+    frame: pd.DataFrame
+    available_sq_ft: np.ndarray
+
+    def sufficient(self, required: float) -> pd.DataFrame:
+        """Options with ``available_sq_ft >= required``, back in aggregation order."""
+        pos = int(np.searchsorted(self.available_sq_ft, required, side="left"))
+        return self.frame.iloc[pos:].sort_index()
+
+
+class OptionIndex:
+    """(branch, thickness) -> OptionSlice lookup, built once per inventory snapshot.
+
+    ``df_agg`` is the aggregated inventory (one row per Thickness_norm / Full
+    Name / Location). Branches missing from ``branch_sources`` fall back to
+    every location, matching the UI's "show all inventory" behaviour.
+    """
+
+    def __init__(self, df_agg: pd.DataFrame, branch_sources: dict[str, list[str]]):
+        df_agg = freeze_frame(df_agg)  # shared by every session; slices are copies
+        self.frame = df_agg
+        self._empty = OptionSlice(df_agg.iloc[0:0], np.empty(0))
+        self._slices: dict[tuple[str | None, str], OptionSlice] = {}
+        self._thicknesses: dict[str | None, list[str]] = {}
+        for branch, sources in [*branch_sources.items(), (None, None)]:
+            sub = df_agg if sources is None else df_agg[df_agg["Location"].isin(sources)]
+            self._thicknesses[branch] = sorted(sub["Thickness_norm"].dropna().unique())
+            for th, grp in sub.groupby("Thickness_norm", observed=True, sort=False):
+                grp = grp.sort_values("available_sq_ft", kind="stable")
+                self._slices[(branch, th)] = OptionSlice(
+                    grp, grp["available_sq_ft"].to_numpy(dtype=float)
+                )
+
+    def _key(self, branch: str | None) -> str | None:
+        return branch if branch in self._thicknesses else None
+
+    def thicknesses(self, branch: str | None) -> list[str]:
+        return self._thicknesses[self._key(branch)]
+
+    def slice(self, branch: str | None, thickness: str) -> OptionSlice:
+        return self._slices.get((self._key(branch), thickness), self._empty)
+
+    def sufficient(self, branch: str | None, thickness: str, required: float) -> pd.DataFrame:
+        return self.slice(branch, thickness).sufficient(required)
@@ -0,0 +1,41 @@
+import time
+from typing import Any, Callable, Hashable
+
+from src import instrument
+
+
+class StageCache:
+    """Memoize a linear pipeline stage by stage.
+
+    Each named stage remembers its last ``(key, output)``; calling ``run`` with
+    the same key returns the stored output without re-running the stage. Keys
+    should capture every input (including upstream stage keys). Outputs are
+    shared between runs, so callers must treat them as read-only.
+
+    ``timings`` holds the wall time of each stage for the current run (0.0 for
+    reused stages) and ``reused`` the names of the stages that were skipped.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[Hashable, Any]] = {}
+        self.timings: dict[str, float] = {}
+        self.reused: set[str] = set()
+
+    def begin_run(self) -> None:
+        self.timings = {}
+        self.reused = set()
+
+    def run(self, name: str, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        entry = self._entries.get(name)
+        hit = entry is not None and entry[0] == key
+        instrument.cache_event(f"pipeline.{name}", hit)
+        if hit:
+            self.timings[name] = 0.0
+            self.reused.add(name)
+            return entry[1]
+        start = time.perf_counter()
+        with instrument.stage(f"pipeline.{name}"):
+            out = fn(*args, **kwargs)
+        self.timings[name] = time.perf_counter() - start
+        self._entries[name] = (key, out)
+        return out
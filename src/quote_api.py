@@ -0,0 +1,345 @@
+"""Local HTTP quote service over the shared inventory snapshot.
+
+Run with ``python -m src.quote_api [--port 8502]``. Endpoints:
+
+* ``GET /quote?branch=Vernon&thickness=3cm&sq_ft=40[&material=...][&limit=20]``
+  (or ``POST /quote`` with the same fields as a JSON object) returns the
+  cheapest options that fit, each with its full ``calculate_cost`` breakdown,
+  the slabs to pull (``cut_serials``), the transfer to the branch's fab plant
+  (``transfer_cost`` / ``lead_days``) and ``compute_taxes`` result. Materials
+  best filled from several locations appear as one option with a combined
+  ``location`` such as "Abbotsford + Vernon".
+* ``GET /health`` reports the inventory snapshot and the thicknesses stocked
+  per branch.
+
+Connections are served by an asyncio loop (HTTP/1.1 keep-alive); pricing runs
+on a small thread pool against one ``OptionIndex`` per inventory snapshot.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from src.cache import Snapshot, SnapshotCache
+from src.costs import (
+    BRANCH_TAX_RATES,
+    MINIMUM_SQ_FT,
+    WASTE_FACTOR,
+    calculate_cost_frame,
+    compute_taxes_frame,
+)
+from src.cut_optimizer import CutPlanner
+from src.data import (
+    BRANCH_TO_MATERIAL_SOURCES,
+    INVENTORY_CSV_URL,
+    INVENTORY_SNAPSHOT_PATH,
+    INVENTORY_TTL_SECONDS,
+    NO_TRANSFER_ROUTES,
+    SerialIndex,
+    TransferRoutes,
+    aggregate_inventory,
+    make_inventory_cache,
+    parse_transfer_routes,
+)
+from src.option_index import OptionIndex
+from src.sourcing import SourcingIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+MAX_BODY_BYTES = 64 * 1024
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+def quote_options(
+    opt_index: OptionIndex,
+    branch: str,
+    thickness: str,
+    sq_ft: float,
+    material: str | None = None,
+    limit: int = DEFAULT_LIMIT,
+    cuts: CutPlanner | None = None,
+    sourcing: SourcingIndex | None = None,
+    routes: TransferRoutes = NO_TRANSFER_ROUTES,
+) -> pd.DataFrame:
+    """Cheapest ``limit`` options with enough material, priced like the app.
+
+    Applies the minimum charge and waste buffer, optionally keeps only
+    materials whose name contains ``material`` (case-insensitive), and adds
+    the ``calculate_cost`` breakdown plus ``price`` / ``price_per_sq_ft``.
+    With ``cuts`` each option is priced from its cut plan (``cut_*`` columns);
+    with ``sourcing`` transfers are charged at ``routes`` and mixed-location
+    plans added.
+    """
+    sq_used = max(sq_ft, MINIMUM_SQ_FT)
+    opts = opt_index.sufficient(branch, thickness, sq_used * WASTE_FACTOR)
+    materials = None
+    if material:
+        # Narrow before planning and sourcing, so only matching materials are worked on.
+        needle = material.upper()
+        materials = {name for name in opt_index.frame["Full Name"].unique() if needle in str(name).upper()}
+        opts = opts[opts["Full Name"].isin(materials)]
+    if cuts is not None:
+        opts = pd.concat([opts, cuts.plan_frame(opts, sq_used)], axis=1)
+    if sourcing is not None:
+        opts = sourcing.for_branch(branch, thickness, materials, routes).apply(opts, sq_used)
+    costs = calculate_cost_frame(opts, sq_used)
+    priced = pd.concat([opts, costs], axis=1)
+    priced["price"] = costs["total_customer_facing_base_cost"]
+    priced["price_per_sq_ft"] = priced["price"] / sq_used
+    return priced.sort_values("price", kind="stable", ignore_index=True).head(limit)
+
+
+class InventoryUnavailable(RuntimeError):
+    """No inventory snapshot could be loaded (nothing cached and the fetch failed)."""
+
+
+def _json_value(v):
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, float) and not math.isfinite(v):
+        return None
+    return v
+
+
+class QuoteService:
+    """Answers quote requests from a (shared) inventory ``SnapshotCache``."""
+
+    def __init__(
+        self,
+        inventory: SnapshotCache,
+        branch_sources: dict[str, list[str]],
+        routes: TransferRoutes = NO_TRANSFER_ROUTES,
+    ):
+        self.inventory = inventory
+        self._branch_sources = branch_sources
+        self._routes = routes
+        self._index: tuple[str, OptionIndex, CutPlanner, SourcingIndex] | None = None
+        self._lock = threading.Lock()
+
+    def option_index(self) -> tuple[OptionIndex, CutPlanner, SourcingIndex, Snapshot]:
+        """Indexes for the current snapshot; rebuilt only when the CSV content changes."""
+        try:
+            snap = self.inventory.get()
+        except Exception as e:
+            raise InventoryUnavailable(f"{type(e).__name__}: {e}") from e
+        df_inv, content_hash = snap.value
+        current = self._index
+        if current is None or current[0] != content_hash:
+            with self._lock:
+                current = self._index
+                if current is None or current[0] != content_hash:
+                    opt_index = OptionIndex(aggregate_inventory(df_inv), self._branch_sources)
+                    serials = SerialIndex(df_inv)
+                    sourcing = SourcingIndex(opt_index.frame, serials, self._branch_sources)
+                    current = (content_hash, opt_index, CutPlanner(serials), sourcing)
+                    self._index = current
+        return current[1], current[2], current[3], snap
+
+    def health(self) -> dict:
+        opt_index, _, _, snap = self.option_index()
+        return {
+            "status": "ok",
+            "inventory": self._inventory_info(snap),
+            "thicknesses": {b: opt_index.thicknesses(b) for b in self._branch_sources},
+        }
+
+    def quote(self, params: dict) -> dict:
+        """Validate request fields and price the matching options; raises ValueError on bad input."""
+        branch = str(params.get("branch") or "").strip().title()
+        if not branch:
+            raise ValueError("branch is required")
+        thickness = str(params.get("thickness") or "3cm").lower().replace(" ", "")
+        try:
+            sq_ft = float(params["sq_ft"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("sq_ft must be a number") from None
+        if not math.isfinite(sq_ft) or sq_ft <= 0:
+            raise ValueError("sq_ft must be positive")
+        try:
+            limit = int(params.get("limit") or DEFAULT_LIMIT)
+            additional_costs = float(params.get("additional_costs") or 0.0)
+        except (TypeError, ValueError):
+            raise ValueError("limit and additional_costs must be numbers") from None
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        if not math.isfinite(additional_costs) or additional_costs < 0:
+            raise ValueError("additional_costs must be zero or more")
+        material = str(params.get("material") or "").strip() or None
+
+        opt_index, cuts, sourcing, snap = self.option_index()
+        priced = quote_options(opt_index, branch, thickness, sq_ft, material, limit, cuts, sourcing, self._routes)
+        tax_rates = BRANCH_TAX_RATES.get(branch, BRANCH_TAX_RATES["default"])
+        taxes = compute_taxes_frame(priced["price"].to_numpy(dtype=float) + additional_costs, tax_rates)
+
+        options = []
+        for rec, tax_info in zip(priced.to_dict("records"), taxes.to_dict("records")):
+            option = {"material": rec.pop("Full Name"), "location": rec.pop("Location")}
+            rec.pop("Thickness_norm")
+            serial_group = rec.pop("serial_group")
+            option.update((k, _json_value(v)) for k, v in rec.items())
+            # Mixed-location options (serial_group -1) only have their plan's serials.
+            option["serial_numbers"] = cuts.serials.get(serial_group) if serial_group >= 0 else rec["cut_serials"]
+            option["taxes"] = tax_info
+            options.append(option)
+
+        return {
+            "branch": branch,
+            "thickness": thickness,
+            "sq_ft": sq_ft,
+            "sq_ft_used": max(sq_ft, MINIMUM_SQ_FT),
+            "material": material,
+            "additional_costs": additional_costs,
+            "inventory": self._inventory_info(snap),
+            "options": options,
+        }
+
+    def _inventory_info(self, snap: Snapshot) -> dict:
+        return {
+            "content_hash": snap.value[1],
+            "age_seconds": round(snap.age_seconds, 1),
+            "refreshing": self.inventory.refreshing,
+            "last_error": None if self.inventory.last_error is None else str(self.inventory.last_error),
+        }
+
+
+class QuoteServer:
+    """Minimal asyncio HTTP/1.1 front end for a ``QuoteService``."""
+
+    def __init__(self, service: QuoteService, workers: int = 4):
+        self.service = service
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quote")
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self._handle, host, port)
+        logger.info("quote API listening on %s", ", ".join(str(s.getsockname()) for s in server.sockets))
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "malformed request line"}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    raw = await reader.readline()
+                    if raw in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = raw.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "request body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                start = time.perf_counter()
+                status, payload = await self._dispatch(method, target, body)
+                await self._respond(writer, status, payload, keep_alive)
+                logger.debug("%s %s %d %.1f ms", method, target, status, (time.perf_counter() - start) * 1000)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> tuple[int, dict]:
+        url = urlsplit(target)
+        loop = asyncio.get_running_loop()
+        try:
+            if url.path == "/health":
+                if method != "GET":
+                    return 405, {"error": "use GET"}
+                return 200, await loop.run_in_executor(self._executor, self.service.health)
+            if url.path == "/quote":
+                if method not in ("GET", "POST"):
+                    return 405, {"error": "use GET or POST"}
+                params = dict(parse_qsl(url.query))
+                if method == "POST" and body:
+                    data = json.loads(body)
+                    if not isinstance(data, dict):
+                        raise ValueError("request body must be a JSON object")
+                    params.update(data)
+                return 200, await loop.run_in_executor(self._executor, self.service.quote, params)
+            return 404, {"error": f"unknown path {url.path}"}
+        except InventoryUnavailable as e:
+            return 503, {"error": f"inventory unavailable: {e}"}
+        except ValueError as e:  # includes malformed JSON
+            return 400, {"error": str(e)}
+        except Exception as e:
+            logger.exception("quote request failed")
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool) -> None:
+        try:
+            body = json.dumps(payload, allow_nan=False).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            # A payload that cannot be serialized is a server bug; answer rather than drop the connection.
+            logger.exception("could not serialize %d response", status)
+            status, body = 500, json.dumps({"error": f"{type(e).__name__}: {e}"}).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=4, help="pricing threads")
+    parser.add_argument("--url", default=INVENTORY_CSV_URL, help="inventory CSV export URL")
+    parser.add_argument("--ttl", type=float, default=INVENTORY_TTL_SECONDS)
+    parser.add_argument("--snapshot-path", default=INVENTORY_SNAPSHOT_PATH)
+    parser.add_argument(
+        "--transfer-routes", help="JSON file of per-slab transfer costs (see parse_transfer_routes); none by default"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    routes = NO_TRANSFER_ROUTES
+    if args.transfer_routes:
+        with open(args.transfer_routes) as f:
+            routes = parse_transfer_routes(json.load(f))
+
+    service = QuoteService(
+        make_inventory_cache(args.url, args.ttl, args.snapshot_path), BRANCH_TO_MATERIAL_SOURCES, routes
+    )
+    service.option_index()  # fail fast (and warm the index) before accepting connections
+    try:
+        asyncio.run(QuoteServer(service, workers=args.workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import bisect
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from src import instrument
+
+_TOKEN = re.compile(r"[0-9a-z]+")
+# Fuzzy candidates per query word, taken by shared trigrams, then checked by edit distance.
+FUZZY_CANDIDATES = 32
+
+
+def _tokens(text: str) -> list[str]:
+    return _TOKEN.findall(str(text).lower())
+
+
+def _trigrams(word: str) -> set[str]:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal-string-alignment distance (a swap of neighbours is one edit), capped at ``limit + 1``.
+
+    Only the diagonal band ``|i - j| <= limit`` is computed; cells outside it exceed the cap.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    prev2, prev = None, [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [over] * (len(b) + 1)
+        if i <= limit:
+            cur[0] = i
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+            if prev2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d = min(d, prev2[j - 2] + 1)
+            cur[j] = d
+        if min(cur) > limit:
+            return over
+        prev2, prev = prev, cur
+    return min(prev[-1], over)
+
+
+class MaterialSearch:
+    """Type-ahead search over material names for one inventory snapshot.
+
+    Every distinct material (Full Name, with its Brand and Color) is split
+    into lower-case words. A query word matches a material word exactly, as
+    a prefix, or, from four letters on, within one typo (two past six
+    letters), prefixes included, e.g. "calacat", "cambira". Candidates for
+    typos come from a trigram index over the vocabulary, so a query touches
+    a few dozen words rather than every material. Every query word must
+    match; materials are ranked by how well, then by name.
+    """
+
+    def __init__(self, df: pd.DataFrame, max_entries: int = 256):
+        fields = [c for c in ("Full Name", "Brand", "Color") if c in df.columns]
+        materials = df[fields].drop_duplicates("Full Name").astype(str).sort_values("Full Name")
+        self.names: list[str] = materials["Full Name"].tolist()
+        self._keys = [" ".join(_tokens(n)) for n in self.names]
+
+        word_materials: dict[str, set[int]] = {}
+        for m, row in enumerate(materials.itertuples(index=False)):
+            for text in row:
+                for w in _tokens(text):
+                    word_materials.setdefault(w, set()).add(m)
+        self._words = sorted(word_materials)
+        self._word_materials = [np.fromiter(sorted(word_materials[w]), dtype=np.int64) for w in self._words]
+
+        postings: dict[str, list[int]] = {}
+        for k, w in enumerate(self._words):
+            for g in _trigrams(w):
+                postings.setdefault(g, []).append(k)
+        self._postings = {g: np.array(ks, dtype=np.int64) for g, ks in postings.items()}
+        # LRU of recent queries; shared by every session, so guarded by a lock.
+        self._results: OrderedDict[str, dict[str, float]] = OrderedDict()
+        self._results_lock = threading.Lock()
+        self._max_entries = max_entries
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _word_scores(self, token: str) -> dict[int, float]:
+        """Vocabulary word -> how well it matches ``token`` (1.0 exact … 0.5 typo in a prefix)."""
+        scores: dict[int, float] = {}
+        lo = bisect.bisect_left(self._words, token)
+        hi = bisect.bisect_left(self._words, token + "\uffff")
+        for k in range(lo, hi):
+            w = self._words[k]
+            scores[k] = 1.0 if w == token else 0.8 + 0.1 * len(token) / len(w)
+        if len(token) < 4:
+            return scores
+
+        limit = 1 if len(token) <= 6 else 2
+        grams = _trigrams(token)
+        hits = [self._postings[g] for g in grams if g in self._postings]
+        if not hits:
+            return scores
+        counts = np.bincount(np.concatenate(hits), minlength=len(self._words))
+        # An edit changes at most four trigrams (a swap); a typo'd prefix also loses the end one.
+        top = np.flatnonzero(counts >= max(1, len(grams) - 1 - 4 * limit))
+        if len(top) > FUZZY_CANDIDATES:
+            top = top[np.argpartition(-counts[top], FUZZY_CANDIDATES)[:FUZZY_CANDIDATES]]
+        for k in top.tolist():
+            if k in scores:
+                continue
+            w = self._words[k]
+            d = _edit_distance(token, w, limit)
+            if d <= limit:
+                scores[k] = 0.7 - 0.1 * d
+            elif len(w) > len(token) and _edit_distance(token, w[: len(token)], 1) <= 1:
+                scores[k] = 0.5
+        return scores
+
+    def search(self, query: str, limit: int | None = None) -> list[str]:
+        """Full Names matching every word of ``query``, best first (all names for an empty query)."""
+        if not _tokens(query):
+            return self.names[:limit]
+        return list(self.scores(query))[:limit]
+
+    def scores(self, query: str) -> dict[str, float]:
+        """Full Name -> relevance for every match of ``query``, best first (ties alphabetical)."""
+        tokens = _tokens(query)
+        key = " ".join(tokens)
+        with self._results_lock:
+            hit = self._results.get(key)
+            if hit is not None:
+                self._results.move_to_end(key)
+        instrument.cache_event("material_search", hit=hit is not None)
+        if hit is None:
+            hit = self._search(tokens, key) if tokens else dict.fromkeys(self.names, 0.0)
+            with self._results_lock:
+                self._results[key] = hit
+                if len(self._results) > self._max_entries:
+                    self._results.popitem(last=False)
+        return hit
+
+    def _search(self, tokens: list[str], key: str) -> dict[str, float]:
+        total = np.zeros(len(self.names))
+        matched = np.ones(len(self.names), dtype=bool)
+        for token in tokens:
+            scores = self._word_scores(token)
+            best = np.zeros(len(self.names))
+            if scores:
+                postings = [self._word_materials[k] for k in scores]
+                rows = np.concatenate(postings)
+                np.maximum.at(best, rows, np.repeat(list(scores.values()), [len(p) for p in postings]))
+            matched &= best > 0
+            total += best
+        # Names that start with the query as typed ("cambria whi…") rank ahead.
+        for m in np.flatnonzero(matched).tolist():
+            if self._keys[m].startswith(key):
+                total[m] += 0.5
+        order = np.flatnonzero(matched)
+        order = order[np.argsort(-total[order], kind="stable")]  # names are sorted: ties stay alphabetical
+        return {self.names[m]: float(total[m]) for m in order.tolist()}
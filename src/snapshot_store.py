@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+_META_KEY = b"countertop_snapshot"
+
+
+@dataclass(frozen=True)
+class StoredSnapshot:
+    """A DataFrame read back from disk with the metadata it was saved with."""
+
+    frame: pd.DataFrame
+    content_hash: str
+    saved_at: float
+
+
+def save_frame_snapshot(
+    path: str,
+    df: pd.DataFrame,
+    content_hash: str,
+    schema_version: int,
+    saved_at: float | None = None,
+) -> None:
+    """Write ``df`` to ``path`` as Parquet, atomically replacing any previous file."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = {
+        "schema_version": schema_version,
+        "content_hash": content_hash,
+        "saved_at": time.time() if saved_at is None else saved_at,
+    }
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), _META_KEY: json.dumps(meta).encode("utf-8")}
+    )
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load_frame_snapshot(path: str, schema_version: int) -> StoredSnapshot | None:
+    """Read a snapshot saved by ``save_frame_snapshot``.
+
+    Returns None when the file is missing, unreadable, or was written with a
+    different ``schema_version`` (i.e. by an older normalization).
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        meta = json.loads((table.schema.metadata or {})[_META_KEY])
+        if meta.get("schema_version") != schema_version:
+            return None
+        return StoredSnapshot(
+            frame=table.to_pandas(),
+            content_hash=str(meta["content_hash"]),
+            saved_at=float(meta["saved_at"]),
+        )
+    except Exception:
+        return None
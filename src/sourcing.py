@@ -0,0 +1,247 @@
+import math
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src import instrument
+from src.costs import WASTE_FACTOR
+from src.data import NO_TRANSFER_ROUTES, SerialIndex, TransferRoutes, get_fab_plant
+
+# Mixed-location plans are tabulated per material for every requirement up to this
+# many sq ft (waste included) on a 1 sq ft grid; bigger jobs get single-location
+# options only. Slab areas are floored and the requirement ceiled on the grid, so
+# every plan covers the job for real.
+MAX_MIXED_SQ_FT = 420
+_MISSING = object()
+
+MIXED_COLUMNS = [
+    "Thickness_norm", "Full Name", "Location", "available_sq_ft", "unit_cost", "slab_count",
+    "serial_group", "cut_slabs", "cut_sq_ft", "cut_serials", "transfer_per_slab", "lead_days",
+]
+
+
+class _MaterialTable:
+    """Cheapest slab set from several locations for every requirement of one material.
+
+    Cost is what the choice changes: each slab's material cost plus its
+    transfer to the fab plant. ``cost[j]`` is the cheapest cover of ``j`` sq ft,
+    built by a 0/1 covering-knapsack DP over the slabs; ``mask[j]`` has a bit
+    per location that cover uses, so single-location answers are skipped
+    without walking the plan back.
+    """
+
+    def __init__(self, locations: list[str], slabs: list[tuple[np.ndarray, np.ndarray, float, float]]):
+        cap = MAX_MIXED_SQ_FT
+        loc, names, areas, weights = [], [], [], []
+        for k, (serials, area, unit_cost, per_slab) in enumerate(slabs):
+            grid = np.minimum(np.floor(area + 1e-6), cap).astype(np.int64)
+            weight = unit_cost * area + per_slab
+            # Among same-sized slabs at one location only the cheapest ceil(cap / size)
+            # can be in a best cover; slabs under 1 sq ft never help.
+            order = np.lexsort((weight, grid))
+            grid, weight, serials, area = grid[order], weight[order], serials[order], area[order]
+            rank = np.arange(len(grid)) - np.searchsorted(grid, grid, side="left")
+            keep = (grid > 0) & (rank < -(-cap // np.maximum(grid, 1)))
+            loc.append(np.full(keep.sum(), k))
+            names.append(serials[keep])
+            areas.append(area[keep])
+            weights.append(weight[keep])
+        self.locations = locations
+        self.loc = np.concatenate(loc)
+        self.names = np.concatenate(names)
+        self.areas = np.concatenate(areas)
+        self.grid = np.minimum(np.floor(self.areas + 1e-6), cap).astype(np.int64)
+
+        cost = np.full(cap + 1, np.inf)
+        cost[0] = 0.0
+        mask = np.zeros(cap + 1, dtype=np.uint32)
+        take = np.zeros((len(self.grid), cap + 1), dtype=bool)
+        j = np.arange(cap + 1)
+        for k, (v, w, b) in enumerate(zip(self.grid.tolist(), np.concatenate(weights).tolist(), self.loc.tolist())):
+            src = np.maximum(j - v, 0)
+            cand = cost[src] + w
+            better = cand < cost
+            take[k] = better
+            cost = np.where(better, cand, cost)
+            mask = np.where(better, mask[src] | np.uint32(1 << b), mask)
+        self.cost = cost
+        self.mask = mask
+        self._take = np.packbits(take, axis=1)
+
+    def mixed_plan(self, need: int) -> np.ndarray | None:
+        """Slab positions of the cheapest cover of ``need`` if it spans several locations."""
+        if not math.isfinite(self.cost[need]) or self.mask[need] & (self.mask[need] - 1) == 0:
+            return None
+        take = np.unpackbits(self._take, axis=1, count=len(self.cost)).view(bool)
+        picked, j = [], need
+        for k in range(len(self.grid) - 1, -1, -1):
+            if j <= 0:
+                break
+            if take[k, j]:
+                picked.append(k)
+                j -= int(self.grid[k])
+        return np.array(picked[::-1], dtype=np.int64)
+
+
+@dataclass(frozen=True)
+class BranchSourcing:
+    """Transfer costs and mixed-location options for one (branch, thickness) query.
+
+    ``materials``, when set, limits the mixed-location rows to those Full Names
+    (e.g. a search's matches), as the caller limits the single-location ones.
+    ``routes`` prices the transfers; memos are keyed on ``routes.key``.
+    """
+
+    index: "SourcingIndex"
+    sources: tuple[str, ...] | None
+    fab_plant: str
+    thickness: str
+    materials: frozenset[str] | None = None
+    routes: TransferRoutes = NO_TRANSFER_ROUTES
+
+    def transfers(self, locations: pd.Series) -> pd.DataFrame:
+        """``transfer_per_slab`` / ``lead_days`` for single-location options."""
+        routes = {loc: self.routes.route(loc, self.fab_plant) for loc in pd.unique(locations)}
+        return pd.DataFrame(
+            {
+                "transfer_per_slab": locations.map(lambda loc: routes[loc][0]).astype(float),
+                "lead_days": locations.map(lambda loc: routes[loc][1]).astype(np.int64),
+            },
+            index=locations.index,
+        )
+
+    def mixed_options(self, sq: float) -> pd.DataFrame:
+        return self.index.mixed_options(self, sq)
+
+    def apply(self, df: pd.DataFrame, sq: float) -> pd.DataFrame:
+        """``df`` with transfer columns, plus a row per material best filled from several locations."""
+        df = pd.concat([df, self.transfers(df["Location"].astype(object))], axis=1)
+        mixed = self.mixed_options(sq)
+        if self.materials is not None:
+            mixed = mixed[mixed["Full Name"].isin(self.materials)]
+        if mixed.empty:
+            return df
+        return pd.concat([df, mixed], ignore_index=True)
+
+
+class SourcingIndex:
+    """Per-snapshot cross-location sourcing over the aggregated inventory.
+
+    A material (thickness + Full Name) stocked at several of a branch's
+    source locations gets one ``_MaterialTable``, built the first time that
+    material is queried and then shared by every job size, session and
+    branch with the same sources, fab plant and transfer routes. A query is then a lookup per
+    material, plus walking back the plans that actually mix locations.
+    """
+
+    def __init__(self, df_agg: pd.DataFrame, serials: SerialIndex, branch_sources: dict[str, list[str]],
+                 max_entries: int = 2_000):
+        self._agg = df_agg
+        self._location = df_agg["Location"].astype(str).to_numpy()
+        self._unit_cost = pd.to_numeric(df_agg["unit_cost"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        self._serial_group = df_agg["serial_group"].to_numpy()
+        self._available = df_agg["available_sq_ft"].to_numpy(dtype=float)
+        self._slab_count = df_agg["slab_count"].to_numpy()
+        self._serials = serials
+        self._branch_sources = branch_sources
+        self._materials: dict[tuple, dict[tuple[str, str], np.ndarray]] = {}
+        self._tables: dict[tuple, _MaterialTable | None] = {}
+        self._mixed: dict[tuple, pd.DataFrame] = {}
+        self._max_entries = max_entries
+
+    def for_branch(
+        self, branch: str | None, thickness: str, materials=None, routes: TransferRoutes = NO_TRANSFER_ROUTES
+    ) -> BranchSourcing:
+        sources = self._branch_sources.get(branch)
+        return BranchSourcing(
+            self,
+            None if sources is None else tuple(sources),
+            get_fab_plant(branch),
+            thickness,
+            None if materials is None else frozenset(materials),
+            routes,
+        )
+
+    def _materials_for(self, sources: tuple[str, ...] | None) -> dict[tuple[str, str], np.ndarray]:
+        """(thickness, Full Name) -> aggregated row positions, for materials at 2+ of ``sources``."""
+        materials = self._materials.get(sources)
+        if materials is None:
+            agg = self._agg
+            pos = np.arange(len(agg))
+            if sources is not None:
+                pos = pos[agg["Location"].isin(sources).to_numpy()]
+            sub = agg.iloc[pos]
+            groups = sub.groupby(["Thickness_norm", "Full Name"], observed=True, sort=False).indices
+            materials = {key: pos[rows] for key, rows in groups.items() if len(rows) > 1}
+            self._materials[sources] = materials
+        return materials
+
+    def _table(self, q: BranchSourcing, name: str, rows: np.ndarray) -> _MaterialTable | None:
+        key = (q.sources, q.fab_plant, q.routes.key, q.thickness, name)
+        table = self._tables.get(key, _MISSING)
+        if table is not _MISSING:
+            return table
+        locations, slabs = [], []
+        for r in rows.tolist():
+            serials, areas = self._serials.slabs(self._serial_group[r])
+            if len(serials):
+                location = self._location[r]
+                locations.append(location)
+                slabs.append((serials, areas, self._unit_cost[r], q.routes.route(location, q.fab_plant)[0]))
+        table = _MaterialTable(locations, slabs) if len(locations) > 1 else None
+        self._tables[key] = table
+        return table
+
+    def mixed_options(self, q: BranchSourcing, sq: float) -> pd.DataFrame:
+        """Materials whose cheapest cover of ``sq`` (plus waste) draws on several locations."""
+        need = math.ceil(sq * WASTE_FACTOR - 1e-9)
+        key = (q.sources, q.fab_plant, q.routes.key, q.thickness, need)
+        # One lookup: another thread may clear the memo between `in` and `[]`.
+        out = self._mixed.get(key)
+        if out is not None:
+            instrument.cache_event("mixed_sourcing", hit=True)
+            return out
+        instrument.cache_event("mixed_sourcing", hit=False)
+        with instrument.stage("mixed_sourcing"):
+            out = self._mixed_options(q, need)
+        if len(self._mixed) >= self._max_entries:
+            self._mixed.clear()
+        self._mixed[key] = out
+        return out
+
+    def _mixed_options(self, q: BranchSourcing, need: int) -> pd.DataFrame:
+        out = []
+        if need > MAX_MIXED_SQ_FT:
+            return pd.DataFrame(columns=MIXED_COLUMNS)
+        for (thickness, name), rows in self._materials_for(q.sources).items():
+            if thickness != q.thickness:
+                continue
+            table = self._table(q, name, rows)
+            picked = None if table is None else table.mixed_plan(need)
+            if picked is None:
+                continue
+            loc = table.loc[picked]
+            areas = table.areas[picked]
+            unit_costs = dict(zip(self._location[rows], self._unit_cost[rows]))
+            routes = [q.routes.route(table.locations[k], q.fab_plant) for k in loc]
+            used = sorted({table.locations[k] for k in loc})
+            order = sorted(range(len(picked)), key=lambda i: (table.locations[loc[i]], table.names[picked[i]]))
+            out.append({
+                "Thickness_norm": thickness,
+                "Full Name": name,
+                "Location": " + ".join(used),
+                "available_sq_ft": float(self._available[rows].sum()),
+                # Area-weighted, so unit_cost × cut_sq_ft is the plan's real slab cost.
+                "unit_cost": float(sum(unit_costs[table.locations[k]] * a for k, a in zip(loc, areas)) / areas.sum()),
+                "slab_count": int(self._slab_count[rows].sum()),
+                "serial_group": -1,
+                "cut_slabs": len(picked),
+                "cut_sq_ft": float(areas.sum()),
+                "cut_serials": ", ".join(
+                    f"{table.names[picked[i]]} ({table.locations[loc[i]]})" for i in order
+                ),
+                "transfer_per_slab": sum(r[0] for r in routes) / len(picked),
+                "lead_days": max(r[1] for r in routes),
+            })
+        return pd.DataFrame(out, columns=MIXED_COLUMNS)
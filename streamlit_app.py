@@ -1,14 +1,48 @@
-import math
+import functools
+import json
+import logging
+import queue
 import streamlit as st
 import pandas as pd
 import gspread
-import json
-import smtplib
-import pytz
-from decimal import Decimal, ROUND_HALF_UP
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from urllib.parse import quote
+
+from src import instrument
+from src.batch import quote_jobs, read_jobs_file
+from src.cache import SnapshotCache, format_age
+from src.costs import (
+    BRANCH_TAX_RATES,
+    MINIMUM_SQ_FT,
+    WASTE_FACTOR,
+    compute_taxes,
+    options_within_budget,
+    price_options,
+)
+from src.cut_optimizer import CutPlanner
+from src.data import (
+    BRANCH_TO_MATERIAL_SOURCES,
+    INVENTORY_CSV_URL,
+    INVENTORY_SNAPSHOT_PATH,
+    INVENTORY_TTL_SECONDS,
+    SALESPEOPLE_TAB,
+    SALESPEOPLE_TTL_SECONDS,
+    SPREADSHEET_ID,
+    SerialIndex,
+    TransferRoutes,
+    aggregate_inventory,
+    get_fab_plant,
+    make_inventory_cache,
+    make_salespeople_cache,
+    parse_transfer_routes,
+)
+from src.email import compose_breakdown_email_body, parse_email_list
+from src.mailer import MailDispatcher, SmtpSettings
+from src.money import money, round_cents
+from src.option_index import OptionIndex
+from src.pipeline import StageCache
+from src.search import MaterialSearch
+from src.sourcing import SourcingIndex
 
 # --- Page config & CSS ---
 st.set_page_config(page_title="CounterPro", page_icon="🧱", layout="centered")
@@ -76,55 +110,9 @@ def logo_svg() -> str:
     </svg>
     """
 
-# --- Constants ---
-MINIMUM_SQ_FT = 35
-MARKUP_FACTOR = 1.51
-INSTALL_COST_PER_SQFT = 21.0
-FABRICATION_COST_PER_SQFT = 15.0  # CHANGED to $15 as requested
-WASTE_FACTOR = 1.05
-IB_MATERIAL_MARKUP = 1.05
-IB_MIN_MARGIN = 0.18  # NEW: ensure IB is at least 18% gross margin over (slab + fab)
-
-# --- Tax configuration by branch ---
-BRANCH_TAX_RATES = {
-    "Vernon":    {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
-    "Victoria":  {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
-    "Vancouver": {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
-    "Calgary":   {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
-    "Edmonton":  {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
-    "Saskatoon": {"gst": 0.05, "pst": 0.06, "pst_name": "PST"},
-    "Winnipeg":  {"gst": 0.05, "pst": 0.00, "pst_name": "RST"},
-    "default":   {"gst": 0.05, "pst": 0.00, "pst_name": "PST"},
-}
-
-# ————————————————————————————————————————————————————————————
-# Inventory CSV + Salespeople GSheet
-INVENTORY_CSV_URL = (
-    "https://docs.google.com/spreadsheets/d/e/"
-    "2PACX-1vRzPf_DEc7ojcjqCsk_5O9HtSFWy7aj2Fi_bPjUh6HVaN38coQSINDps0RGrpiM9ox58izhsNkzD51j/"
-    "pub?output=csv"
-)
-SPREADSHEET_ID = "166G-39R1YSGTjlJLulWGrtE-Reh97_F__EcMlLPa1iQ"
-SALESPEOPLE_TAB = "Salespeople"
-# ————————————————————————————————————————————————————————————
 
 # --- Helpers -------------------------------------------------------------------
 
-def money(x: float | Decimal) -> str:
-    try:
-        d = Decimal(str(x)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    except Exception:
-        d = Decimal("0.00")
-    return f"${d:,.2f}"
-
-
-def parse_email_list(s: str | None) -> list[str]:
-    if not s:
-        return []
-    parts = [p.strip() for p in s.replace(";", ",").split(",")]
-    return [p for p in parts if p]
-
-
 def safe_get_secret(key: str, required: bool = False, default: str | None = None) -> str | None:
     try:
         val = st.secrets.get(key, default)
@@ -137,328 +125,125 @@ def safe_get_secret(key: str, required: bool = False, default: str | None = None
         return default
 
 
-def get_fab_plant(branch: str) -> str:
-    return "Abbotsford" if branch in ["Vernon", "Victoria", "Vancouver"] else "Saskatoon"
+@st.cache_resource(show_spinner=False)
+def perf_logger(target: str) -> logging.Logger:
+    """JSON-lines logger for per-rerun reports: ``target`` is "stderr" or a file path."""
+    logger = logging.getLogger("countertop.perf")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = logging.StreamHandler() if target.lower() in ("1", "true", "stderr") else logging.FileHandler(target)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+def finish_perf(recorder: instrument.Recorder | None, show_panel: bool, log_target: str | None) -> None:
+    """Close out this rerun's instrumentation: one JSON log line and/or the admin panel."""
+    if recorder is None:
+        return
+    instrument.activate(None)
+    report = recorder.report()
+    if log_target:
+        perf_logger(log_target).info(json.dumps(report, separators=(",", ":")))
+    if show_panel:
+        with st.sidebar.expander("⏱️ Performance (this rerun)", expanded=True):
+            st.caption(f"Script time {report['total_ms']:.1f} ms")
+            if report["stages"]:
+                st.dataframe(
+                    pd.DataFrame.from_dict(report["stages"], orient="index").rename_axis("stage"),
+                    use_container_width=True,
+                )
+            st.json({"cache": report["cache"], "rows": report["rows"]}, expanded=False)
+            st.download_button(
+                "Download JSON", json.dumps(report, indent=2), file_name="rerun_perf.json", mime="application/json",
+            )
 
 # --- Data loading & normalization ---------------------------------------------
 
-@st.cache_data(show_spinner=False)
-def load_salespeople_sheet(tab_name: str) -> pd.DataFrame:
-    try:
-        raw = st.secrets["gcp_service_account"]
-        creds = json.loads(raw) if isinstance(raw, str) else raw
-        gc = gspread.service_account_from_dict(creds)
-        ws = gc.open_by_key(SPREADSHEET_ID).worksheet(tab_name)
-        df = pd.DataFrame(ws.get_all_records())
-        df.columns = df.columns.str.strip()
-        return df
-    except Exception as e:
-        st.error(f"❌ Could not load Google Sheet tab '{tab_name}': {e}")
-        return pd.DataFrame()
+@st.cache_resource(show_spinner=False)
+def gspread_client() -> gspread.Client:
+    """One authorized client per process; its session refreshes the OAuth token in place."""
+    raw = st.secrets["gcp_service_account"]
+    creds = json.loads(raw) if isinstance(raw, str) else raw
+    return gspread.service_account_from_dict(creds)
 
 
-@st.cache_data(show_spinner=False)
-def load_inventory_csv(url: str) -> pd.DataFrame:
-    return pd.read_csv(url)
+@st.cache_resource(show_spinner=False)
+def salespeople_cache(tab_name: str, ttl: float) -> SnapshotCache:
+    """Process-wide Salespeople tab (stale-while-revalidate over the shared client)."""
+    gc = gspread_client()
+    return make_salespeople_cache(lambda: gc.open_by_key(SPREADSHEET_ID).worksheet(tab_name), ttl)
 
 
-def normalize_inventory_df(df: pd.DataFrame) -> pd.DataFrame:
-    df.columns = df.columns.str.strip()
+@st.cache_resource(show_spinner=False)
+def inventory_cache(url: str, ttl: float, snapshot_path: str) -> SnapshotCache:
+    """Process-wide normalized inventory shared by every session (stale-while-revalidate)."""
+    return make_inventory_cache(url, ttl, snapshot_path)
 
-    # Available Sq Ft
-    if "Available Qty" in df.columns:
-        df["Available Sq Ft"] = pd.to_numeric(df["Available Qty"], errors="coerce")
-    elif "Available Sq Ft" in df.columns:
-        df["Available Sq Ft"] = pd.to_numeric(df["Available Sq Ft"], errors="coerce")
-    else:
-        st.error(
-            "❌ Could not find either 'Available Qty' or 'Available Sq Ft' in the inventory CSV.\n"
-            f"Columns found: {df.columns.tolist()}"
-        )
-        st.stop()
 
-    # Unit Cost (per sq ft)
-    if "Serialized Unit Cost" in df.columns:
-        df["unit_cost"] = pd.to_numeric(
-            df["Serialized Unit Cost"].astype(str).str.replace(r"[\$,]", "", regex=True),
-            errors="coerce",
-        )
-    elif "Serialized On Hand Cost" in df.columns:
-        df["SerialOnHandCost"] = pd.to_numeric(
-            df["Serialized On Hand Cost"].astype(str).str.replace(r"[\$,]", "", regex=True),
-            errors="coerce",
-        )
-        denom = df["Available Sq Ft"].replace(0, pd.NA)
-        df["unit_cost"] = df["SerialOnHandCost"] / denom
-    else:
-        st.error(
-            "❌ Could not find 'Serialized Unit Cost' or 'Serialized On Hand Cost' in the inventory CSV.\n"
-            f"Columns found: {df.columns.tolist()}"
-        )
-        st.stop()
+@st.cache_resource(show_spinner=False, max_entries=2)
+def prepare_inventory(content_hash: str, _df_inv: pd.DataFrame) -> OptionIndex:
+    """Aggregate + index once per distinct inventory CSV (keyed on its content hash).
+
+    Shared read-only across sessions; callers must not mutate the slices.
+    """
+    return OptionIndex(aggregate_inventory(_df_inv), BRANCH_TO_MATERIAL_SOURCES)
 
-    # Basic filtering
-    df = df[
-        df["Available Sq Ft"].notna() & (df["Available Sq Ft"] > 0)
-        & df["unit_cost"].notna() & (df["unit_cost"] > 0)
-    ]
 
-    # Clean text fields
-    for c in ["Brand", "Color", "Thickness"]:
-        if c in df.columns:
-            df[c] = df[c].astype(str).str.strip()
-        else:
-            df[c] = ""
+@st.cache_resource(show_spinner=False, max_entries=2)
+def serial_index(content_hash: str, _df_inv: pd.DataFrame) -> SerialIndex:
+    """Serial-number and slab-area lookup per inventory CSV."""
+    return SerialIndex(_df_inv)
 
-    df["Full Name"] = df["Brand"] + " - " + df["Color"]
 
-    # Normalize thickness for robust matching (e.g., "3 cm" => "3cm")
-    df["Thickness_norm"] = df["Thickness"].str.lower().str.replace(" ", "", regex=False)
+@st.cache_resource(show_spinner=False, max_entries=2)
+def cut_planner(content_hash: str, _df_inv: pd.DataFrame) -> CutPlanner:
+    """Memoized slab cut plans per inventory CSV, shared by every session."""
+    return CutPlanner(serial_index(content_hash, _df_inv))
 
-    return df
 
-# --- Pricing -------------------------------------------------------------------
+@st.cache_resource(show_spinner=False, max_entries=2)
+def sourcing_index(content_hash: str, _df_inv: pd.DataFrame) -> SourcingIndex:
+    """Cross-location sourcing tables per inventory CSV, filled in per material on first use."""
+    return SourcingIndex(
+        prepare_inventory(content_hash, _df_inv).frame,
+        serial_index(content_hash, _df_inv),
+        BRANCH_TO_MATERIAL_SOURCES,
+    )
 
-def calculate_cost(rec: dict, sq: float) -> dict:
-    uc = float(rec.get("unit_cost", 0) or 0)
 
-    # Determine how many full slabs are required to satisfy the job (with waste)
-    # rather than charging for every square foot currently in stock.
-    available_sq_ft = float(rec.get("available_sq_ft", 0) or 0)
-    slab_count = int(rec.get("slab_count", 0) or 0)
-    required_sq_ft = sq * WASTE_FACTOR
+@st.cache_resource(show_spinner=False, max_entries=2)
+def transfer_routes(config_json: str) -> TransferRoutes:
+    """Transfer routes parsed once per secret value and shared read-only by every session."""
+    return parse_transfer_routes(json.loads(config_json))
 
-    avg_slab_sq_ft = 0.0
-    if slab_count > 0 and available_sq_ft > 0:
-        avg_slab_sq_ft = available_sq_ft / slab_count
 
-    if avg_slab_sq_ft > 0:
-        slabs_needed = max(1, math.ceil(required_sq_ft / avg_slab_sq_ft))
-        if slab_count:
-            slabs_needed = min(slabs_needed, slab_count)
-        slab_sq_ft = slabs_needed * avg_slab_sq_ft
-    else:
-        slab_sq_ft = max(required_sq_ft, sq, available_sq_ft)
-
-    material_cost_used = uc * sq
-    total_slab_cost = uc * slab_sq_ft
-    unused_material_cost = max(total_slab_cost - material_cost_used, 0.0)
-
-    # Customer-facing build: charge the full slab cost, but only mark up the
-    # portion of material used on the job.
-    material_markup = material_cost_used * max(MARKUP_FACTOR - 1.0, 0.0)
-    mat_component = total_slab_cost + material_markup
-    fab_component = FABRICATION_COST_PER_SQFT * sq
-    ins_component = INSTALL_COST_PER_SQFT * sq
-
-    # IB pricing — ensure at least 18% margin on the full slab + fabrication cost.
-    base_cost_for_ib_total = total_slab_cost + fab_component
-    if base_cost_for_ib_total > 0:
-        ib_candidate_margin_total = base_cost_for_ib_total / (1.0 - IB_MIN_MARGIN)
-    else:
-        ib_candidate_margin_total = 0.0
+@st.cache_resource(show_spinner=False, max_entries=2)
+def material_search(content_hash: str, _df_inv: pd.DataFrame) -> MaterialSearch:
+    """Type-ahead index over Brand / Color / Full Name per inventory CSV."""
+    return MaterialSearch(_df_inv)
 
-    ib_candidate_markup_total = (
-        (material_cost_used * IB_MATERIAL_MARKUP)
-        + unused_material_cost
-        + fab_component
-    )
 
-    if ib_candidate_margin_total >= ib_candidate_markup_total:
-        ib_total = ib_candidate_margin_total
-        ib_method = "margin_floor"  # 18% floor applied on full cost
-    else:
-        ib_total = ib_candidate_markup_total
-        ib_method = "markup_chain"   # legacy markup method with unused cost pass-through
-
-    # Margin % is (price - cost) / price
-    ib_margin_pct = 0.0
-    if ib_total > 0:
-        ib_margin_pct = 1.0 - (base_cost_for_ib_total / ib_total)
-
-    ib_per_sq = ib_total / sq if sq else 0.0
-    ib_base_cost_per_sq = base_cost_for_ib_total / sq if sq else 0.0
-
-    return {
-        "base_material_and_fab_component": mat_component + fab_component,
-        "base_install_cost_component":     ins_component,
-        "ib_cost_component":               ib_total,
-        "total_customer_facing_base_cost": mat_component + fab_component + ins_component,
-        # Extras for UI transparency
-        "ib_per_sq": ib_per_sq,
-        "ib_base_cost_per_sq": ib_base_cost_per_sq,
-        "ib_margin_pct": ib_margin_pct,
-        "ib_method": ib_method,
-    }
-
-
-def compute_taxes(subtotal: float, tax_rates: dict) -> dict:
-    gst_rate = float(tax_rates.get("gst", 0.05))
-    pst_rate = float(tax_rates.get("pst", 0.00))
-    pst_name = tax_rates.get("pst_name", "PST")
-
-    gst_amt = Decimal(str(subtotal * gst_rate)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    pst_amt = Decimal(str(subtotal * pst_rate)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    final   = Decimal(str(subtotal)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) + gst_amt + pst_amt
-
-    return {
-        "gst_rate": gst_rate,
-        "pst_rate": pst_rate,
-        "pst_name": pst_name,
-        "gst_amount": float(gst_amt),
-        "pst_amount": float(pst_amt),
-        "final_total": float(final),
-    }
-
-
-def compute_taxes(subtotal: float, tax_rates: dict) -> dict:
-    gst_rate = float(tax_rates.get("gst", 0.05))
-    pst_rate = float(tax_rates.get("pst", 0.00))
-    pst_name = tax_rates.get("pst_name", "PST")
-
-    gst_amt = Decimal(str(subtotal * gst_rate)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    pst_amt = Decimal(str(subtotal * pst_rate)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    final   = Decimal(str(subtotal)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) + gst_amt + pst_amt
-
-    return {
-        "gst_rate": gst_rate,
-        "pst_rate": pst_rate,
-        "pst_name": pst_name,
-        "gst_amount": float(gst_amt),
-        "pst_amount": float(pst_amt),
-        "final_total": float(final),
-    }
+def matching_options(df_agg: pd.DataFrame, matches: dict[str, float]) -> pd.DataFrame:
+    return df_agg[df_agg["Full Name"].isin(matches)]
+
+
+def by_relevance(df_agg: pd.DataFrame, matches: dict[str, float]) -> pd.DataFrame:
+    """Best search matches first; equally good ones keep their price order."""
+    score = df_agg["Full Name"].astype(object).map(matches)
+    return df_agg.iloc[(-score).argsort(kind="stable").to_numpy()]
 
 # --- Email & HTML --------------------------------------------------------------
 
-def compose_breakdown_email_body(
-    job_name: str,
-    selected_branch: str,
-    selected_salesperson: str,
-    rec: dict,
-    costs: dict,
-    fab_plant: str,
-    selected_thickness: str,
-    sq_ft_used: float,
-    additional_costs: float,
-    subtotal: float,
-    tax_info: dict,
-    final_total: float,
-) -> str:
-    tz = pytz.timezone("America/Vancouver")
-    now = pd.Timestamp.now(tz=tz).strftime("%Y-%m-%d %H:%M:%S %Z")
-    job = job_name or "Unnamed Job"
-
-    # Transfer request button (supports multiple recipients)
-    transfer_button_html = ""
-    try:
-        to_emails = parse_email_list(st.secrets.get("TRANSFER_REQUEST_EMAIL"))
-        to_display = ",".join(to_emails) if to_emails else ""
-        if rec.get("Location") != fab_plant and to_display:
-            subject = f"Slab Transfer Request - Job: {job}"
-            body = f"""
-Please initiate a transfer for the following slab(s):
-
-PO: 
-JOB LINK: 
-
-Job Name: {job}
-Material: {rec.get("Full Name", "N/A")}
-Serial Number(s): {rec.get("serial_numbers", "N/A")}
-
-FROM (Current Location): {rec.get("Location", "N/A")}
-TO (Fabrication Plant): {fab_plant}
-
-Thank you,
-{selected_salesperson}
-            """
-            mailto_link = f"mailto:{quote(to_display)}?subject={quote(subject)}&body={quote(body)}"
-            transfer_button_html = f"""
-<p style="text-align: center; margin-top: 25px;">
-  <a href="{mailto_link}" target="_blank" style="background-color: #2563eb; color: white; padding: 12px 20px; text-decoration: none; border-radius: 5px; font-size: 16px;">
-    Request Slab Transfer
-  </a>
-</p>
-<p style="text-align: center; font-size: 12px; color: #666;">
-  (Material is at a different location from the fabrication plant)
-</p>
-            """
-    except Exception:
-        transfer_button_html = "<p style='color: red; text-align: center;'>Could not create transfer button.</p>"
-
-    pst_row_html = ""
-    if tax_info.get("pst_amount", 0) > 0:
-        pst_name = tax_info.get("pst_name", "PST")
-        pst_rate_pct = tax_info.get("pst_rate", 0) * 100
-        pst_row_html = f"""
-        <tr>
-            <td>{pst_name} ({pst_rate_pct:.0f}%):</td>
-            <td>{money(tax_info["pst_amount"])}</td>
-        </tr>
-        """
-
-    return f"""<html>
-<head><style>
-  body {{ font-family: Arial, sans-serif; color: #333; }}
-  .container {{ max-width: 640px; margin: 0 auto; padding: 20px; }}
-  h1 {{ color: #0056b3; margin-bottom: 4px; }}
-  p.meta {{ margin: 0; font-size: 0.9rem; color: #555; }}
-  h2 {{ color: #0056b3; border-bottom: 1px solid #eee; padding-bottom: 5px; margin-top: 20px; }}
-  table {{ width: 100%; border-collapse: collapse; margin: 10px 0; }}
-  th, td {{ padding: 8px; text-align: left; border-bottom: 1px solid #ddd; }}
-  th {{ background: #f0f0f0; }}
-  .grand-total-row td {{ font-weight: bold; background: #c9e0ff; font-size: 1rem; }}
-  .footer {{ font-size: 10px; color: #666; text-align: center; margin-top: 20px; }}
-</style></head>
-<body>
-  <div class="container">
-    <h1>CounterPro Estimate</h1>
-    <p class="meta">
-      <strong>Branch:</strong> {selected_branch} &nbsp;&nbsp;
-      <strong>Salesperson:</strong> {selected_salesperson}
-    </p>
-
-    <h2>Project &amp; Material Overview</h2>
-    <table>
-      <tr><th>Detail</th><th>Value</th></tr>
-      <tr><td>Job Name:</td><td>{job}</td></tr>
-      <tr><td>Slab Selected:</td><td>{rec.get("Full Name", "N/A")}</td></tr>
-      <tr><td>Material Source:</td><td>{rec.get("Location", "N/A")}</td></tr>
-      <tr><td>Fabrication Plant:</td><td>{fab_plant}</td></tr>
-      <tr><td>Thickness:</td><td>{selected_thickness}</td></tr>
-      <tr><td>Sq Ft (for pricing):</td><td>{sq_ft_used} sq.ft</td></tr>
-      <tr><td>Slab Sq Ft (Total):</td><td>{rec.get("available_sq_ft", 0):.2f} sq.ft</td></tr>
-      <tr><td>Unique Slabs:</td><td>{rec.get("slab_count", 0)}</td></tr>
-      <tr><td>Serial Numbers:</td><td>{rec.get("serial_numbers", "N/A")}</td></tr>
-    </table>
-
-    <h2>Cost Components</h2>
-    <table>
-      <tr><th>Component</th><th>Amount</th></tr>
-      <tr><td>Material &amp; Fabrication:</td><td>{money(costs["base_material_and_fab_component"])}</td></tr>
-      <tr><td>Installation:</td><td>{money(costs["base_install_cost_component"])}</td></tr>
-      <tr><td>IB Cost (Internal):</td><td>{money(costs["ib_cost_component"])}</td></tr>
-    </table>
-
-    <h2>Totals</h2>
-    <table>
-      <tr><th>Description</th><th>Amount</th></tr>
-      <tr><td>Base Estimate:</td><td>{money(costs["total_customer_facing_base_cost"])}</td></tr>
-      <tr><td>Additional Costs (sinks, tile, plumbing):</td><td>{money(additional_costs)}</td></tr>
-      <tr><td>Subtotal:</td><td>{money(subtotal)}</td></tr>
-      <tr><td>GST ({tax_info.get("gst_rate", 0) * 100:.0f}%):</td><td>{money(tax_info.get("gst_amount", 0))}</td></tr>
-      {pst_row_html}
-      <tr class="grand-total-row"><td>Final Total:</td><td>{money(final_total)}</td></tr>
-    </table>
-
-    {transfer_button_html}
-    <div class="footer">Generated by CounterPro on {now}</div>
-  </div>
-</body>
-</html>"""
+@st.cache_resource(show_spinner=False)
+def mail_dispatcher(settings: SmtpSettings) -> MailDispatcher:
+    """Process-wide outbound mail worker holding one authenticated SMTP connection."""
+    return MailDispatcher(settings)
 
 
+@instrument.timed("email_queue")
 def send_email(subject: str, body: str, to_email: str):
+    """Queue the quote for background delivery; returns the MailJob (or None on error)."""
     try:
         frm = safe_get_secret("SENDER_FROM_EMAIL", required=True)
         smtp_server = safe_get_secret("SMTP_SERVER", required=True)
@@ -477,17 +262,153 @@ def send_email(subject: str, body: str, to_email: str):
         msg.attach(MIMEText(body, "html"))
 
         recipients = to_list + cc_list
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_pass)
-            server.sendmail(frm, recipients, msg.as_string())
+        dispatcher = mail_dispatcher(SmtpSettings(smtp_server, smtp_port, smtp_user, smtp_pass))
+        return dispatcher.submit(msg, frm, recipients)
+    except queue.Full:
+        st.error("Email failed: the outgoing mail queue is full. Please try again in a minute.")
+    except Exception as e:
+        st.error(f"Email failed: {e}")
+    return None
+
 
+def show_email_result(job) -> None:
+    if job.status == "sent":
         st.success("✅ Quote emailed successfully.")
+    else:
+        st.error(f"Email failed: {job.error}")
+
+
+@st.fragment(run_every=1.0)
+def email_status_panel(job) -> None:
+    # Polls the background send; a full rerun shows the final result once.
+    if job.done:
+        st.rerun()
+    label = "retrying" if job.status == "retrying" else "sending"
+    st.info(f"📨 Quote {label}…" + (f" ({job.error})" if job.error else ""))
+
+# --- Batch quoting -------------------------------------------------------------
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def batch_quote_results(
+    content_hash: str, file_name: str, data: bytes, default_branch: str, top_n: int,
+    routes_key: str, _opt_index: OptionIndex, _cuts: CutPlanner, _sourcing: SourcingIndex, _routes: TransferRoutes,
+) -> pd.DataFrame:
+    results = quote_jobs(
+        read_jobs_file(file_name, data, default_branch), _opt_index, top_n, _cuts, _sourcing, _routes
+    )
+    results = results.rename(columns={
+        "Thickness_norm": "Thickness",
+        "Full Name": "Material",
+        "price": "Base Estimate",
+        "price_per_sq_ft": "$/sq ft",
+        "ib_cost_component": "IB Cost (Internal)",
+        "slabs_needed": "Slabs Needed",
+        "available_sq_ft": "Slab Sq Ft (Total)",
+        "slab_count": "Unique Slabs",
+        "cut_serials": "Slabs to Pull",
+        "transfer_cost": "Transfer Cost",
+        "lead_days": "Transfer Days",
+        "gst_amount": "GST",
+        "pst_amount": "PST",
+        "final_total": "Total (incl. tax)",
+    })
+    for c in ["Rank", "Slabs Needed", "Unique Slabs", "Transfer Days"]:
+        results[c] = results[c].astype("Int64")
+    for c in ["Base Estimate", "$/sq ft", "IB Cost (Internal)", "Transfer Cost", "GST", "PST", "Total (incl. tax)"]:
+        results[c] = round_cents(results[c])
+    results["Slab Sq Ft (Total)"] = results["Slab Sq Ft (Total)"].astype(float).round(2)
+    return results
+
+
+def render_batch_quotes(
+    opt_index: OptionIndex,
+    cuts: CutPlanner,
+    sourcing: SourcingIndex,
+    routes: TransferRoutes,
+    content_hash: str,
+    default_branch: str,
+) -> None:
+    st.markdown("<div class='section-title'>Batch Quote</div>", unsafe_allow_html=True)
+    st.caption(
+        "Upload a CSV or Excel file with one job per row: a job name and square footage, "
+        "plus optional Thickness and Branch columns (defaults: 3 cm, the branch selected above)."
+    )
+    uploaded = st.file_uploader("Jobs file", type=["csv", "xlsx", "xls"])
+    top_n = int(st.number_input("Options per job", min_value=1, max_value=50, value=5, step=1))
+    if uploaded is None:
+        return
+    try:
+        results = batch_quote_results(
+            content_hash, uploaded.name, uploaded.getvalue(), default_branch or "", top_n,
+            routes.key, opt_index, cuts, sourcing, routes,
+        )
     except Exception as e:
-        st.error(f"Email failed: {e}")
+        st.error(f"❌ Could not read jobs file: {e}")
+        return
+
+    n_jobs = results["Job"].nunique()
+    st.caption(f"Priced {n_jobs} job(s) → {len(results)} row(s).")
+    st.dataframe(results, hide_index=True, use_container_width=True)
+    base = uploaded.name.rsplit(".", 1)[0]
+    st.download_button(
+        label="⬇️ Download Results (CSV)",
+        data=results.to_csv(index=False),
+        file_name=f"CounterPro_Batch_{base.replace(' ', '_')}.csv",
+        mime="text/csv",
+        use_container_width=True,
+    )
+
 
 # --- MAIN APP UI ---------------------------------------------------------------
 
+# Per-rerun instrumentation, off unless an admin opens ?timings=<ADMIN_TOKEN> or
+# PERF_LOG (stderr or a file path) is set; when off the probes are no-ops.
+_admin_token = safe_get_secret("ADMIN_TOKEN")
+show_perf = bool(_admin_token) and st.query_params.get("timings") == _admin_token
+perf_log_target = safe_get_secret("PERF_LOG")
+perf = instrument.Recorder() if (show_perf or perf_log_target) else None
+instrument.activate(perf)
+
+
+def stop_rerun() -> None:
+    finish_perf(perf, show_perf, perf_log_target)
+    st.stop()
+
+
+# Per-slab transfer costs and lead days to the fab plants; none are charged until
+# the TRANSFER_ROUTES secret is set (a TOML table or a JSON string). Parsed once per
+# secret value; memos of transfer-dependent results are keyed on ``routes.key``.
+try:
+    _routes = safe_get_secret("TRANSFER_ROUTES")
+    if not isinstance(_routes, str):
+        _routes = json.dumps(_routes, sort_keys=True, default=dict)
+    routes = transfer_routes(_routes)
+except ValueError as e:
+    st.error(f"Invalid `TRANSFER_ROUTES` secret: {e}")
+    stop_rerun()
+
+
+# Start both sheet fetches before waiting on either, so a cold start waits for the
+# slower of the two rather than their sum. Loaded caches just do their usual
+# staleness check; errors stay per source and surface at the .get() below.
+sp_cache = sp_error = None
+try:
+    sp_cache = salespeople_cache(
+        SALESPEOPLE_TAB,
+        float(safe_get_secret("SALESPEOPLE_TTL_SECONDS", default=None) or SALESPEOPLE_TTL_SECONDS),
+    )
+    sp_cache.load_async()
+except Exception as e:  # e.g. missing or invalid service-account secret
+    sp_error = e
+inv_cache = inventory_cache(
+    INVENTORY_CSV_URL,
+    float(safe_get_secret("INVENTORY_TTL_SECONDS", default=None) or INVENTORY_TTL_SECONDS),
+    safe_get_secret("INVENTORY_SNAPSHOT_PATH", default=None) or INVENTORY_SNAPSHOT_PATH,
+)
+inv_cache.load_async()
+
+
 header_html = f"""
 <div class='app-header'>
   <div class='brand'>{logo_svg()}<span class='brand-title'>CounterPro</span></div>
@@ -496,15 +417,24 @@ header_html = f"""
 """
 st.markdown(header_html, unsafe_allow_html=True)
 
+quote_mode = st.sidebar.radio("Mode", ["Single quote", "Batch quote"])
+if perf is not None:
+    perf.label = quote_mode
+
 st.markdown("<div class='section-title'>Branch & Salesperson</div>", unsafe_allow_html=True)
 
 
 # 1) Branch & Salesperson
-df_sp = load_salespeople_sheet(SALESPEOPLE_TAB)
+try:
+    if sp_cache is None:
+        raise sp_error
+    df_sp = sp_cache.get().value
+except Exception as e:
+    st.error(f"❌ Could not load Google Sheet tab '{SALESPEOPLE_TAB}': {e}")
+    df_sp = pd.DataFrame()
 selected_email = None
 
 if not df_sp.empty:
-    df_sp["Branch"] = df_sp["Branch"].astype(str).str.strip().str.title()
     branch_list = sorted(df_sp["Branch"].dropna().unique())
 
     col1, col2 = st.columns(2)
@@ -526,37 +456,37 @@ else:
     selected_branch = ""
     selected_salesperson = ""
 
-# 2) Load & normalize Inventory
+# 2) Load & normalize Inventory (fetch started above, alongside the salespeople tab)
 try:
-    df_inv_raw = load_inventory_csv(INVENTORY_CSV_URL)
+    inv_snapshot = inv_cache.get()
 except Exception as e:
-    st.error(f"❌ Could not fetch inventory CSV: {e}")
-    st.stop()
-
-if df_inv_raw.empty:
-    st.error("❌ Loaded inventory CSV is empty.")
-    st.stop()
-
-df_inv = normalize_inventory_df(df_inv_raw)
-
-# 3) Filter by Branch→Source location
-branch_to_material_sources = {
-    "Vernon":    ["Vernon", "Abbotsford"],
-    "Victoria":  ["Vernon", "Abbotsford"],
-    "Vancouver": ["Vernon", "Abbotsford"],
-    "Calgary":   ["Edmonton", "Saskatoon"],
-    "Edmonton":  ["Edmonton", "Saskatoon"],
-    "Saskatoon": ["Edmonton", "Saskatoon"],
-    "Winnipeg":  ["Edmonton", "Saskatoon"],
-}
-allowed_sources = branch_to_material_sources.get(selected_branch, [])
-if allowed_sources:
-    df_inv = df_inv[df_inv["Location"].isin(allowed_sources)]
-else:
+    st.error(f"❌ Could not load inventory CSV: {e}")
+    stop_rerun()
+
+df_inv, inv_hash = inv_snapshot.value
+inv_status = f"Inventory snapshot age: {format_age(inv_snapshot.age_seconds)}"
+if inv_cache.refreshing:
+    inv_status += " · refreshing in background"
+elif inv_cache.last_error is not None:
+    inv_status += f" · last refresh failed ({inv_cache.last_error}); showing last good snapshot"
+st.caption(inv_status)
+
+# Aggregated + indexed once per CSV content; reruns are dictionary lookups.
+opt_index = prepare_inventory(inv_hash, df_inv)
+cuts = cut_planner(inv_hash, df_inv)
+sourcing = sourcing_index(inv_hash, df_inv)
+
+if quote_mode == "Batch quote":
+    render_batch_quotes(opt_index, cuts, sourcing, routes, inv_hash, selected_branch)
+    stop_rerun()
+
+# 3) Branch→Source locations (resolved by the index)
+allowed_sources = BRANCH_TO_MATERIAL_SOURCES.get(selected_branch, [])
+if not allowed_sources:
     st.warning(f"No material-source mapping for branch '{selected_branch}'. Showing all inventory.")
 
 # 4) Thickness selector — default to 3 cm (normalized to '3cm')
-th_values = sorted(df_inv["Thickness_norm"].dropna().unique())
+th_values = opt_index.thicknesses(selected_branch)
 default_th_idx = th_values.index("3cm") if "3cm" in th_values else 0
 selected_thickness_norm = st.selectbox(
     "Select Thickness",
@@ -565,7 +495,6 @@ selected_thickness_norm = st.selectbox(
     format_func=lambda t: "3 cm" if t == "3cm" else t,
 )
 
-df_inv = df_inv[df_inv["Thickness_norm"] == selected_thickness_norm]
 selected_thickness_label = "3 cm" if selected_thickness_norm == "3cm" else selected_thickness_norm
 
 # 5) Square footage input
@@ -574,33 +503,48 @@ sq_ft_used = max(sq_ft_input, MINIMUM_SQ_FT)
 if sq_ft_input < MINIMUM_SQ_FT:
     st.caption(f"Minimum charge applies: using {MINIMUM_SQ_FT} sq.ft for pricing.")
 
-# 6) Aggregate & ensure material sufficiency with waste buffer
-required = sq_ft_used * WASTE_FACTOR
-df_agg = (
-    df_inv.groupby(["Full Name", "Location"])  # group within location to respect transfers
-    .agg(
-        available_sq_ft=("Available Sq Ft", "sum"),
-        unit_cost=("unit_cost", "mean"),
-        slab_count=("Serial Number", "nunique"),
-        serial_numbers=("Serial Number", lambda x: ", ".join(sorted(x.astype(str).unique()))),
-    )
-    .reset_index()
-)
-
-df_agg = df_agg[df_agg["available_sq_ft"] >= required]
-
-if df_agg.empty:
-    st.error(f"❌ No slabs have enough material (including {int((WASTE_FACTOR - 1) * 100)}% buffer).")
-    st.stop()
+# 5b) Optional material search: narrows the options before they are priced
+search_query = st.text_input(
+    "Search materials", placeholder="Brand or color, e.g. cambria white (typos are OK)"
+).strip()
 
-# Price each option
+# Stages below are memoized per session on their inputs: e.g. moving the budget
+# slider reuses the priced + sorted options and only re-runs the budget cut.
+stages = st.session_state.setdefault("_pipeline_stages", StageCache())
+stages.begin_run()
 
-df_agg["price"] = df_agg.apply(
-    lambda r: calculate_cost(r, sq_ft_used)["total_customer_facing_base_cost"],
-    axis=1,
+# 6) Ensure material sufficiency with waste buffer
+required = sq_ft_used * WASTE_FACTOR
+options_key = (inv_hash, routes.key, selected_branch, selected_thickness_norm, required)
+df_agg = stages.run(
+    "options", options_key,
+    opt_index.sufficient, selected_branch, selected_thickness_norm, required,
+)
+instrument.rows("options", len(df_agg))
+
+matches = None
+if search_query:
+    matches = material_search(inv_hash, df_inv).scores(search_query)
+    if not matches:
+        st.error(f"❌ No materials match '{search_query}'.")
+        stop_rerun()
+    df_agg = stages.run("search", (options_key, search_query), matching_options, df_agg, matches)
+    instrument.rows("search", len(df_agg))
+
+# Price each option from the actual slabs it would use, moved to the fab plant, next
+# to materials best filled from several locations (columnar; see calculate_cost for
+# the per-record reference). A job no single location can fill may still get options.
+priced_key = (options_key, search_query, sq_ft_used)
+df_agg = stages.run(
+    "pricing", priced_key,
+    price_options, df_agg, sq_ft_used, cuts,
+    sourcing.for_branch(selected_branch, selected_thickness_norm, matches, routes),
 )
 
-df_agg = df_agg.sort_values("price", ascending=True, ignore_index=True)
+if df_agg.empty:
+    matching = f" matching '{search_query}'" if search_query else ""
+    st.error(f"❌ No slabs{matching} have enough material (including {int((WASTE_FACTOR - 1) * 100)}% buffer).")
+    stop_rerun()
 
 # 7) Defensive budget slider
 mi, ma = int(df_agg["price"].min()), int(df_agg["price"].max())
@@ -610,28 +554,45 @@ else:
     span = ma - mi
     step = 100 if span >= 100 else (span if span > 0 else 1)
     budget = st.slider("Max Job Cost ($)", mi, ma, ma, step=step)
-    df_agg = df_agg[df_agg["price"] <= budget]
+    df_agg = stages.run("budget", (priced_key, budget), options_within_budget, df_agg, budget)
+    instrument.rows("within_budget", len(df_agg))
     if df_agg.empty:
         st.error("❌ No materials fall within that budget.")
-        st.stop()
+        stop_rerun()
+if matches is not None:
+    df_agg = stages.run("relevance", (priced_key, budget if mi != ma else None), by_relevance, df_agg, matches)
 
 # 8) Choose a material (shows final $/sq ft)
-records = df_agg.to_dict("records")
-selected = st.selectbox(
+option_labels = df_agg["label"].tolist()
+selected_pos = st.selectbox(
     "Choose a material",
-    records,
-    format_func=lambda r: (
-        f"{r['Full Name']} – "
-        f"{money(calculate_cost(r, sq_ft_used)['total_customer_facing_base_cost'] / sq_ft_used)}/sq ft"
-    ),
+    range(len(df_agg)),
+    format_func=option_labels.__getitem__,
 )
+selected = df_agg.iloc[selected_pos].to_dict() if selected_pos is not None else None
+if selected:
+    # The quote / transfer email lists the slabs to pull; all of the group's serials
+    # only when no cut plan exists (e.g. slabs without serial numbers).
+    selected["serial_numbers"] = selected["cut_serials"] or serial_index(inv_hash, df_inv).get(
+        selected["serial_group"]
+    )
 
 # 9) Detail + quote
 if selected:
-    costs = calculate_cost(selected, sq_ft_used)
+    costs = selected  # full cost breakdown was computed once by price_options
 
     st.markdown(f"**Material:** {selected['Full Name']}")
     st.markdown(f"**Source Location:** {selected['Location']}")
+    if selected["cut_serials"]:
+        st.markdown(
+            f"**Slabs to Pull:** {selected['cut_serials']} "
+            f"({int(selected['cut_slabs'])} slab(s), {selected['cut_sq_ft']:.2f} sq ft)"
+        )
+    if selected["transfer_cost"] > 0:
+        st.markdown(
+            f"**Transfer to {get_fab_plant(selected_branch)}:** {money(selected['transfer_cost'])} "
+            f"(+{int(selected['lead_days'])} days lead time)"
+        )
     q = selected["Full Name"].replace(" ", "+")
     st.markdown(f"[🔎 Google Image Search](https://www.google.com/search?q={q}+countertop)")
 
@@ -661,11 +622,13 @@ if selected:
         )
     st.markdown(f"### <span style='color:green'>Final Total: {money(final_total)}</span>", unsafe_allow_html=True)
 
-    if selected["slab_count"] > 1:
+    slabs_used = selected["cut_slabs"] if selected["cut_sq_ft"] > 0 else selected["slab_count"]
+    if slabs_used > 1:
         st.info("Note: This selection uses multiple slabs; color/pattern may vary slightly.")
 
-    # Compose HTML for download/email
-    body_html = compose_breakdown_email_body(
+    # Quote HTML is rendered only when the download or email action fires.
+    render_quote = functools.partial(
+        compose_breakdown_email_body,
         job_name=job_name,
         selected_branch=selected_branch,
         selected_salesperson=selected_salesperson,
@@ -684,12 +647,13 @@ if selected:
             "pst_name": tax_info["pst_name"],
         },
         final_total=final_total,
+        transfer_emails=parse_email_list(safe_get_secret("TRANSFER_REQUEST_EMAIL")),
     )
 
     # Download quote as HTML
     st.download_button(
         label="⬇️ Download Quote (HTML)",
-        data=body_html,
+        data=render_quote,
         file_name=f"CounterPro_Quote_{(job_name or 'Unnamed').replace(' ', '_')}.html",
         mime="text/html",
         use_container_width=True,
@@ -699,6 +663,15 @@ if selected:
     if selected_email:
         if st.button("📧 Email Quote", use_container_width=True):
             subject = f"CounterPro Quote – {job_name or 'Unnamed Job'}"
-            send_email(subject, body_html, selected_email)
+            st.session_state["email_job"] = send_email(subject, render_quote(), selected_email)
+        email_job = st.session_state.get("email_job")
+        if email_job is not None:
+            if email_job.done:
+                show_email_result(email_job)
+                del st.session_state["email_job"]
+            else:
+                email_status_panel(email_job)
     else:
         st.warning("No salesperson email found for the selected branch.")
+
+finish_perf(perf, show_perf, perf_log_target)
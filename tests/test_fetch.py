@@ -0,0 +1,100 @@
+import hashlib
+import http.server
+import threading
+
+import pytest
+
+from src.fetch import ConditionalLoader
+
+CSV = b"Location,Serial Number\nVernon,1\nAbbotsford,2\n"
+
+
+class _Stub(http.server.BaseHTTPRequestHandler):
+    """Serves ``server.body``, with an ETag and 304s when ``server.etags`` is on."""
+
+    def do_GET(self):
+        body = self.server.body
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        self.server.requests.append(self.headers.get("If-None-Match"))
+        if self.server.etags and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.server.etags:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            pass  # the client stopped reading early
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    server.body, server.etags, server.requests = CSV, True, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _loader(server) -> tuple[ConditionalLoader, list[bytes]]:
+    parsed = []
+    loader = ConditionalLoader(
+        f"http://127.0.0.1:{server.server_port}/inventory.csv", parse=lambda f: parsed.append(f.read()) or len(parsed)
+    )
+    return loader, parsed
+
+
+def test_unchanged_etag_is_one_304_and_no_parse(stub):
+    loader, parsed = _loader(stub)
+    first = loader.load()
+    second = loader.load()
+
+    assert second == first
+    assert parsed == [CSV]
+    assert stub.requests[1] == '"%s"' % hashlib.md5(CSV).hexdigest()
+    assert loader.stats["not_modified"] == 1
+    assert loader.stats["parses"] == 1
+    assert loader.stats["bytes"] == len(CSV)
+
+
+def test_same_body_without_validators_is_not_reparsed(stub):
+    stub.etags = False
+    loader, parsed = _loader(stub)
+    results = [loader.load() for _ in range(3)]
+
+    assert results[0] == results[1] == results[2]
+    assert parsed == [CSV]
+    assert loader.stats["unchanged"] == 2
+
+
+def test_changed_body_is_parsed_again(stub):
+    loader, parsed = _loader(stub)
+    _, first_hash = loader.load()
+    stub.body = CSV + b"Edmonton,3\n"
+    value, second_hash = loader.load()
+
+    assert value == 2
+    assert second_hash != first_hash
+    assert parsed == [CSV, stub.body]
+
+
+def test_bad_head_stops_the_download(stub):
+    stub.body = b"Brand,Color\n" + b"x,y\n" * 1_000_000
+
+    def check_head(head: bytes) -> None:
+        if not head.startswith(b"Location,"):
+            raise ValueError("bad header")
+
+    loader = ConditionalLoader(f"http://127.0.0.1:{stub.server_port}/", parse=pytest.fail, check_head=check_head)
+    with pytest.raises(ValueError, match="bad header"):
+        loader.load()
+    assert loader.stats["bytes"] < len(stub.body)
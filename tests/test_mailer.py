@@ -0,0 +1,118 @@
+import socketserver
+import threading
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+from src.mailer import MailDispatcher, SmtpSettings
+
+
+class _SmtpStub(socketserver.StreamRequestHandler):
+    """Just enough ESMTP for smtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, QUIT."""
+
+    def reply(self, text: str) -> None:
+        self.wfile.write(text.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stub ESMTP")
+        envelope = None
+        while line := self.rfile.readline():
+            verb, _, arg = line.decode().strip().partition(" ")
+            verb = verb.upper()
+            if verb == "EHLO":
+                self.reply("250-stub\r\n250-AUTH PLAIN\r\n250 8BITMIME")
+            elif verb == "AUTH":
+                server.logins += 1
+                self.reply("235 authenticated")
+            elif verb == "MAIL":
+                envelope = {"from": arg, "rcpt": [], "data": b""}
+                self.reply("250 ok")
+            elif verb == "RCPT":
+                if any(r in arg for r in server.refuse):
+                    self.reply("550 no such user")
+                else:
+                    envelope["rcpt"].append(arg)
+                    self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 end with .")
+                while (data := self.rfile.readline()) != b".\r\n":
+                    envelope["data"] += data
+                server.messages.append(envelope)
+                self.reply("250 queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 ok")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+@pytest.fixture
+def smtp():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SmtpStub)
+    server.daemon_threads = True
+    server.connections, server.logins, server.messages, server.refuse = 0, 0, [], ()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _dispatcher(server, **kwargs) -> MailDispatcher:
+    settings = SmtpSettings("127.0.0.1", server.server_address[1], "user", "secret", starttls=False, timeout=5)
+    return MailDispatcher(settings, **kwargs)
+
+
+def _message(subject: str) -> MIMEText:
+    msg = MIMEText(f"<p>{subject}</p>", "html")
+    msg["Subject"] = subject
+    return msg
+
+
+def _wait(*jobs, timeout: float = 5.0) -> None:
+    deadline = time.time() + timeout
+    while not all(job.done for job in jobs):
+        assert time.time() < deadline, [job.status for job in jobs]
+        time.sleep(0.01)
+
+
+def test_queued_mail_shares_one_connection(smtp):
+    dispatcher = _dispatcher(smtp)
+    first = dispatcher.submit(_message("Quote 1"), "quotes@example.com", ["a@example.com"])
+    second = dispatcher.submit(_message("Quote 2"), "quotes@example.com", ["b@example.com", "cc@example.com"])
+    _wait(first, second)
+
+    assert (first.status, second.status) == ("sent", "sent")
+    assert dispatcher.status(second.id) is second
+    assert (smtp.connections, smtp.logins) == (1, 1)
+    assert [m["rcpt"] for m in smtp.messages] == [
+        ["TO:<a@example.com>"],
+        ["TO:<b@example.com>", "TO:<cc@example.com>"],
+    ]
+    assert b"Subject: Quote 2" in smtp.messages[1]["data"]
+
+
+def test_refused_recipient_fails_without_retry(smtp):
+    smtp.refuse = ("nobody@example.com",)
+    dispatcher = _dispatcher(smtp, backoff=0.01)
+    job = dispatcher.submit(_message("Quote"), "quotes@example.com", ["nobody@example.com"])
+    _wait(job)
+
+    assert job.status == "failed"
+    assert job.attempts == 1
+    assert "SMTPRecipientsRefused" in job.error
+    assert smtp.messages == []
+
+
+def test_idle_connection_is_closed_and_reopened(smtp):
+    dispatcher = _dispatcher(smtp, idle_timeout=0.05)
+    _wait(dispatcher.submit(_message("Quote 1"), "quotes@example.com", ["a@example.com"]))
+    time.sleep(0.2)
+    _wait(dispatcher.submit(_message("Quote 2"), "quotes@example.com", ["a@example.com"]))
+
+    assert smtp.connections == 2
+    assert len(smtp.messages) == 2
@@ -0,0 +1,85 @@
+import pytest
+
+from src.data import SALESPEOPLE_TAB, SPREADSHEET_ID, make_salespeople_cache
+
+ROWS = [
+    {"Branch": " vernon ", "SalespersonName": "Ann", "Email": "ann@example.com"},
+    {"Branch": "Saskatoon", "SalespersonName": "Bo", "Email": "bo@example.com"},
+]
+
+
+class FakeWorksheet:
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = 0
+
+    def get_all_records(self):
+        self.reads += 1
+        if isinstance(self.rows, Exception):
+            raise self.rows
+        return [dict(r) for r in self.rows]
+
+
+class FakeClient:
+    """Stands in for gspread.Client: open_by_key(...).worksheet(...) returns ``ws``."""
+
+    def __init__(self, ws: FakeWorksheet):
+        self.ws = ws
+        self.opened = []
+
+    def open_by_key(self, key):
+        return self
+
+    def worksheet(self, title):
+        self.opened.append(title)
+        return self.ws
+
+
+@pytest.fixture
+def client():
+    return FakeClient(FakeWorksheet(ROWS))
+
+
+def _cache(client, ttl=600):
+    return make_salespeople_cache(lambda: client.open_by_key(SPREADSHEET_ID).worksheet(SALESPEOPLE_TAB), ttl)
+
+
+def test_first_get_loads_and_normalizes(client):
+    df = _cache(client).get().value
+
+    assert list(df["Branch"]) == ["Vernon", "Saskatoon"]
+    assert list(df["SalespersonName"]) == ["Ann", "Bo"]
+    assert client.opened == [SALESPEOPLE_TAB]
+
+
+def test_refreshes_reuse_the_open_worksheet(client):
+    cache = _cache(client, ttl=0)
+    cache.get()
+    assert cache.refresh()
+    assert cache.refresh()
+
+    assert client.ws.reads == 3
+    assert client.opened == [SALESPEOPLE_TAB]
+
+
+def test_failed_read_keeps_snapshot_and_reopens(client):
+    cache = _cache(client, ttl=0)
+    first = cache.get()
+    client.ws.rows = ConnectionError("quota exceeded")
+
+    assert not cache.refresh()
+    assert cache.snapshot is first
+    assert isinstance(cache.last_error, ConnectionError)
+
+    client.ws.rows = ROWS[:1]
+    assert cache.refresh()
+    assert list(cache.snapshot.value["SalespersonName"]) == ["Ann"]
+    assert client.opened == [SALESPEOPLE_TAB, SALESPEOPLE_TAB]
+
+
+def test_empty_sheet_is_an_error(client):
+    client.ws.rows = []
+    cache = _cache(client)
+
+    with pytest.raises(ValueError, match="no rows"):
+        cache.get()